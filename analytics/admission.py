@@ -0,0 +1,133 @@
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, request
+
+# Mỗi client (theo IP): RATE_PER_SECOND request/giây, burst tối đa BURST
+RATE_PER_SECOND = 5.0
+BURST = 20
+# Số request ingest được xử lý đồng thời trên toàn server (SQLite chỉ có một writer)
+MAX_IN_FLIGHT = 8
+# Sync lớn hơn sẽ được chia thành nhiều transaction nhỏ
+MAX_INGEST_BATCH = 200
+# Số bucket giữ trong bộ nhớ trước khi dọn các bucket đã đầy lại
+MAX_TRACKED_CLIENTS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, now, cost=1):
+        # Trả về 0 nếu được phép, ngược lại số giây cần chờ
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST, max_in_flight=MAX_IN_FLIGHT):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.counters = {
+            'admitted': 0,
+            'rejected_rate_limit': 0,
+            'rejected_overload': 0,
+            'split_batches': 0
+        }
+
+    def try_admit(self, client_id):
+        # Trả về (True, 0) hoặc (False, retry_after_seconds)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                    self._prune(now)
+                bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst)
+
+            wait = bucket.try_consume(now)
+            if wait:
+                self.counters['rejected_rate_limit'] += 1
+                return False, wait
+
+            if self._in_flight >= self.max_in_flight:
+                # Hoàn lại token - request không được xử lý
+                bucket.tokens += 1
+                self.counters['rejected_overload'] += 1
+                return False, 1
+
+            self._in_flight += 1
+            self.counters['admitted'] += 1
+            return True, 0
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def count_split(self, chunks):
+        with self._lock:
+            self.counters['split_batches'] += chunks
+
+    def _prune(self, now):
+        idle = [key for key, bucket in self._buckets.items() if bucket.is_full(now)]
+        for key in idle:
+            del self._buckets[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'tracked_clients': len(self._buckets)
+            }
+
+
+controller = AdmissionController()
+
+
+def admission_controlled(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return view(*args, **kwargs)
+
+        admitted, retry_after = controller.try_admit(request.remote_addr or 'unknown')
+        if not admitted:
+            response = jsonify({'status': 'error', 'message': 'Too many requests, retry later'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return response
+
+        try:
+            return view(*args, **kwargs)
+        finally:
+            controller.release()
+    return wrapper
+
+
+def split_batch(rows, size=MAX_INGEST_BATCH):
+    chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+    if len(chunks) > 1:
+        controller.count_split(len(chunks))
+    return chunks
@@ -7,35 +7,82 @@ import atexit
 import signal
 import sys
 import os
+import time
+
+from admission import admission_controlled, controller as admission, split_batch
+from correlations import Correlations, correlations_from_db
+from event_log import get_event_log, init_event_tables, parse_events, start_compactor
+from game_registry import GAMES, get_game
+from ingest_validation import validate_batch
+from leaderboard import LEADERBOARD_SIZE, METRICS as LEADERBOARD_METRICS, WINDOW_ALL, Leaderboard, query_leaderboard
+from survival import ALL_REASONS, DEFAULT_THRESHOLD, SURVIVAL_BINS, SurvivalCurves, survival_from_db
+from live_state import ROW_COLUMNS, init_state_tables, load_state, save_state, start_snapshotter
+from live_state import state as live_state
+from predict_service import Predictor, SessionError, load_predictor
+from profiling import admin_required, init_profiling, profiler
+from read_replica import read_connection, staleness_info, start_replica_refresher
+from static_artifacts import build_data_artifacts, build_stats_artifacts
+from timestamps import RANGE_SQL, TimeRangeError, migrate_epoch_columns, parse_time_range, range_params
+from retention import (SCORE_BUCKETS, enable_incremental_vacuum, init_archive_tables, iter_archived_sessions,
+                       load_archive_aggregates, migrate_received_at, score_bucket, start_archiver,
+                       summarize_sessions)
 
 app = Flask(__name__)
 CORS(app)  # Cho phép cross-origin requests
+init_profiling(app)  # Hook profiling theo request, mặc định tắt
+
+# Model dự đoán - được load trong __main__
+predictor = Predictor()
+
+# Các component in-memory được cập nhật khi ingest và lưu trong state snapshot
+leaderboard = live_state.register(Leaderboard())
+survival_curves = live_state.register(SurvivalCurves())
+correlations = live_state.register(Correlations())
 
 # Database setup
 def init_db():
     conn = sqlite3.connect('plane_analytics.db')
     c = conn.cursor()
+    # Mỗi game có bảng riêng (Flappy Plane: game_sessions)
+    for game in GAMES.values():
+        c.execute(game.create_sql)
     c.execute('''
-        CREATE TABLE IF NOT EXISTS game_sessions (
-            id TEXT PRIMARY KEY,
-            start_time TEXT,
-            end_time TEXT,
-            score INTEGER,
-            coins_collected INTEGER,
-            ufos_shot INTEGER,
-            bullets_fired INTEGER,
-            death_reason TEXT,
-            game_duration INTEGER,
-            pipes_passed INTEGER,
-            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        CREATE TABLE IF NOT EXISTS quarantine_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_id TEXT,
+            reason TEXT,
+            field TEXT,
+            payload TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            game TEXT DEFAULT 'plane'
         )
     ''')
+    # Migration: quarantine_sessions cũ chưa có cột game
+    if 'game' not in [row[1] for row in c.execute('PRAGMA table_info(quarantine_sessions)')]:
+        c.execute("ALTER TABLE quarantine_sessions ADD COLUMN game TEXT DEFAULT 'plane'")
+    init_archive_tables(c)
+    init_state_tables(c)
+    init_event_tables(c)
     conn.commit()
+    # Migration: cột epoch ms (start_ms, end_ms) + index, backfill theo batch
+    for game in GAMES.values():
+        migrate_epoch_columns(conn, game.table)
+        # Migration: bảng cũ chưa có received_at, backfill từ end_ms
+        migrate_received_at(conn, game.table)
+    # Index cho truy vấn archive theo thời gian nhận
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_sessions_received_at ON game_sessions (received_at)')
+    enable_incremental_vacuum(conn)
+    # WAL: writer không chặn reader và backup cho read replica
+    conn.execute('PRAGMA journal_mode=WAL')
     conn.close()
 
 # THÊM: Hàm xử lý tắt server
 def shutdown_handler(signum=None, frame=None):
     print("\n🛑 Server is shutting down gracefully...")
+    try:
+        save_state()
+    except Exception as e:
+        print(f"Error saving state snapshot: {e}")
     print("💾 Analytics data has been saved to plane_analytics.db")
     sys.exit(0)
 
@@ -45,6 +92,7 @@ signal.signal(signal.SIGINT, shutdown_handler)
 signal.signal(signal.SIGTERM, shutdown_handler)
 
 @app.route('/api/game-analytics', methods=['POST', 'OPTIONS'])
+@admission_controlled
 def receive_analytics():
     if request.method == 'OPTIONS':
         return '', 200
@@ -63,41 +111,63 @@ def receive_analytics():
         print(f"Error storing analytics: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# THÊM: Writer dùng chung cho mọi game - validate cả batch một lần theo schema của game,
+# row lỗi được ghi hàng loạt vào quarantine_sessions
+def store_sessions(conn, analytics_list, game=GAMES['plane']):
+    valid_rows, rejected_rows = validate_batch(analytics_list, game.checkers)
+    # Cùng gameId xuất hiện nhiều lần trong batch: giữ bản cuối; thêm start_ms / end_ms
+    valid_rows = [game.normalize(row) for row in {row[0]: row for row in valid_rows}.values()]
+    # Live state (stats, leaderboard, survival) chỉ theo dõi Flappy Plane
+    tracked = game.name == 'plane'
+    c = conn.cursor()
+
+    with live_state.lock:
+        replaced = []
+        marks = None
+        if valid_rows:
+            if tracked:
+                replaced = live_state.capture_replaced(c, [row[0] for row in valid_rows])
+            c.executemany(game.insert_sql, valid_rows)
+            if tracked:
+                marks = live_state.written_marks(c)
+
+        if rejected_rows:
+            c.executemany('''
+                INSERT INTO quarantine_sessions (game_id, reason, field, payload, game)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [row + (game.name,) for row in rejected_rows])
+            print(f"Quarantined {len(rejected_rows)} invalid {game.name} analytics")
+
+        conn.commit()
+
+        # Cập nhật aggregates in-memory: trừ bản cũ bị ghi đè, cộng bản mới
+        if tracked and live_state.loaded:
+            live_state.apply(replaced, -1)
+            live_state.apply(dict(zip(ROW_COLUMNS, row)) for row in valid_rows)
+            if marks is not None:
+                live_state.advance(marks)
+
+    return len(valid_rows), rejected_rows
+
 # THÊM: Xử lý batch analytics
-def process_batch_analytics(analytics_list):
+def process_batch_analytics(analytics_list, game=GAMES['plane']):
     try:
         conn = sqlite3.connect('plane_analytics.db')
-        c = conn.cursor()
-        
+
+        # Chia sync lớn thành nhiều transaction để không giữ write lock quá lâu
         success_count = 0
-        for data in analytics_list:
-            try:
-                c.execute('''
-                    INSERT OR REPLACE INTO game_sessions 
-                    (id, start_time, end_time, score, coins_collected, ufos_shot, bullets_fired, death_reason, game_duration, pipes_passed)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    data.get('gameId'),
-                    data.get('startTime'),
-                    data.get('endTime'),
-                    data.get('score'),
-                    data.get('coinsCollected'),
-                    data.get('ufosShot'),
-                    data.get('bulletsFired'),
-                    data.get('deathReason'),
-                    data.get('gameDuration'),
-                    data.get('pipesPassed')
-                ))
-                success_count += 1
-            except Exception as e:
-                print(f"Error processing game {data.get('gameId')}: {e}")
-        
-        conn.commit()
+        quarantined = 0
+        for chunk in split_batch(analytics_list):
+            stored, rejected_rows = store_sessions(conn, chunk, game)
+            success_count += stored
+            quarantined += len(rejected_rows)
+
         conn.close()
         
         return jsonify({
             'status': 'success', 
-            'message': f'Processed {success_count}/{len(analytics_list)} analytics'
+            'message': f'Processed {success_count}/{len(analytics_list)} analytics',
+            'quarantined': quarantined
         }), 200
         
     except Exception as e:
@@ -105,30 +175,15 @@ def process_batch_analytics(analytics_list):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 # THÊM: Xử lý single analytics
-def process_single_analytics(data):
+def process_single_analytics(data, game=GAMES['plane']):
     try:
         conn = sqlite3.connect('plane_analytics.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT OR REPLACE INTO game_sessions 
-            (id, start_time, end_time, score, coins_collected, ufos_shot, bullets_fired, death_reason, game_duration, pipes_passed)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('gameId'),
-            data.get('startTime'),
-            data.get('endTime'),
-            data.get('score'),
-            data.get('coinsCollected'),
-            data.get('ufosShot'),
-            data.get('bulletsFired'),
-            data.get('deathReason'),
-            data.get('gameDuration'),
-            data.get('pipesPassed')
-        ))
-        
-        conn.commit()
+        _, rejected_rows = store_sessions(conn, [data], game)
         conn.close()
+
+        if rejected_rows:
+            _, reason, field, _ = rejected_rows[0]
+            return jsonify({'status': 'rejected', 'reason': reason, 'field': field}), 400
         
         return jsonify({'status': 'success'}), 200
         
@@ -138,6 +193,7 @@ def process_single_analytics(data):
 
 # THÊM: Endpoint để client đồng bộ dữ liệu local
 @app.route('/api/sync-analytics', methods=['POST', 'OPTIONS'])
+@admission_controlled
 def sync_analytics():
     if request.method == 'OPTIONS':
         return '', 200
@@ -154,19 +210,105 @@ def sync_analytics():
         print(f"Error syncing analytics: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# THÊM: Ingest chung cho các game khác (snake, ball, cat) - schema lấy từ game_registry
+@app.route('/api/games/<game_name>/analytics', methods=['POST', 'OPTIONS'])
+@admission_controlled
+def receive_game_analytics(game_name):
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    game = get_game(game_name)
+    if game is None:
+        return jsonify({'status': 'error', 'message': f'Unknown game: {game_name}'}), 404
+
+    try:
+        data = request.get_json()
+
+        if isinstance(data, dict) and 'games' in data:
+            data = data['games']
+        if isinstance(data, list):
+            return process_batch_analytics(data, game)
+        else:
+            return process_single_analytics(data, game)
+
+    except Exception as e:
+        print(f"Error storing {game_name} analytics: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# THÊM: Event chi tiết trong game, ghi theo batch vào event log (không INSERT từng event)
+@app.route('/api/games/<game_name>/events', methods=['POST', 'OPTIONS'])
+@admission_controlled
+def receive_game_events(game_name):
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    if get_game(game_name) is None:
+        return jsonify({'status': 'error', 'message': f'Unknown game: {game_name}'}), 404
+
+    try:
+        data = request.get_json()
+
+        # {gameId, events} hoặc danh sách / {'sessions': [...]} cho nhiều game
+        if isinstance(data, dict) and 'sessions' in data:
+            data = data['sessions']
+        batches = data if isinstance(data, list) else [data]
+
+        parsed = []
+        for batch in batches:
+            game_id = batch.get('gameId') if isinstance(batch, dict) else None
+            if not isinstance(game_id, str) or not 0 < len(game_id) <= 128:
+                return jsonify({'status': 'rejected', 'reason': 'gameId is required'}), 400
+            events, error = parse_events(batch.get('events'))
+            if error:
+                return jsonify({'status': 'rejected', 'reason': error, 'gameId': game_id}), 400
+            parsed.append((game_id, events))
+
+        log = get_event_log(game_name)
+        for game_id, events in parsed:
+            log.append(game_id, events)
+
+        return jsonify({
+            'status': 'success',
+            'sessions': len(parsed),
+            'events': sum(len(events) for _, events in parsed)
+        })
+
+    except Exception as e:
+        print(f"Error storing {game_name} events: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# THÊM: Timeline event của một session, đọc qua index theo gameId
+@app.route('/api/games/<game_name>/events/<game_id>')
+def get_game_events(game_name, game_id):
+    if get_game(game_name) is None:
+        return jsonify({'error': f'Unknown game: {game_name}'}), 404
+
+    try:
+        conn = sqlite3.connect('plane_analytics.db')
+        events = get_event_log(game_name).timeline(conn, game_id)
+        conn.close()
+
+        return jsonify({'game': game_name, 'gameId': game_id, 'count': len(events), 'events': events})
+
+    except Exception as e:
+        print(f"Error retrieving {game_name} events: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # THÊM: Export data to JSON file
 @app.route('/api/export-data')
 def export_data():
     try:
-        conn = sqlite3.connect('plane_analytics.db')
+        time_range = parse_time_range(request.args)
+        conn, lag = read_connection()
         c = conn.cursor()
         
-        # Lấy tất cả data
-        c.execute('''
+        # Lấy tất cả data (hoặc trong khoảng ?from=&to= theo end_ms)
+        range_filter = '' if time_range is None else f'WHERE {RANGE_SQL}'
+        c.execute(f'''
             SELECT id, start_time, end_time, score, coins_collected, ufos_shot, 
                    bullets_fired, death_reason, game_duration, pipes_passed
-            FROM game_sessions
-        ''')
+            FROM game_sessions {range_filter}
+        ''', range_params(time_range) if time_range else ())
         
         games = []
         for row in c.fetchall():
@@ -184,140 +326,159 @@ def export_data():
             })
         
         conn.close()
+
+        # Thêm các session đã được archive (file nén theo tháng)
+        for row in iter_archived_sessions(time_range=time_range):
+            games.append({
+                'id': row['id'],
+                'startTime': row['start_time'],
+                'endTime': row['end_time'],
+                'score': row['score'],
+                'coinsCollected': row['coins_collected'],
+                'ufosShot': row['ufos_shot'],
+                'bulletsFired': row['bullets_fired'],
+                'deathReason': row['death_reason'],
+                'gameDuration': row['game_duration'],
+                'pipesPassed': row['pipes_passed']
+            })
         
-        # Tạo thư mục data nếu chưa tồn tại
-        os.makedirs('static/data', exist_ok=True)
-        
-        # Export to JSON file
-        with open('static/data/analytics.json', 'w', encoding='utf-8') as f:
-            json.dump({
-                'games': games,
-                'last_updated': datetime.now().isoformat(),
-                'total_games': len(games)
-            }, f, indent=2)
+        # Export: analytics.json (tóm tắt) + chunk JSON có hash, kèm bản nén .gz / .br
+        summary = build_data_artifacts(games, datetime.now().isoformat())
         
-        return jsonify({'status': 'success', 'exported_games': len(games)})
+        return jsonify({
+            'status': 'success',
+            'exported_games': len(games),
+            'chunks': len(summary['chunks']),
+            **staleness_info(lag)
+        })
         
+    except TimeRangeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         print(f"Error exporting data: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-# THÊM: Generate complete stats data for static usage
-def generate_complete_stats():
-    try:
-        conn = sqlite3.connect('plane_analytics.db')
-        c = conn.cursor()
-        
-        # Basic stats
-        c.execute('SELECT COUNT(*), AVG(score), MAX(score), AVG(game_duration), AVG(bullets_fired) FROM game_sessions')
-        result = c.fetchone()
-        total_games = result[0] if result[0] else 0
-        avg_score = round(result[1] or 0, 1)
-        max_score = result[2] or 0
-        avg_duration = round(result[3] or 0, 1)
-        avg_bullets = round(result[4] or 0, 1)
-        
-        # Death reasons
-        c.execute('SELECT death_reason, COUNT(*) FROM game_sessions WHERE death_reason IS NOT NULL GROUP BY death_reason')
-        death_reasons = dict(c.fetchall())
-        
-        # Recent games
-        c.execute('''
-            SELECT score, coins_collected, ufos_shot, bullets_fired, game_duration, death_reason 
-            FROM game_sessions 
-            ORDER BY end_time DESC 
-            LIMIT 10
-        ''')
-        recent_games = [
-            {
-                'score': row[0],
-                'coins': row[1],
-                'ufos': row[2],
-                'bullets': row[3],
-                'duration': row[4],
-                'death_reason': row[5]
-            }
-            for row in c.fetchall()
-        ]
-        
-        # Score distribution
-        c.execute('SELECT score FROM game_sessions')
-        scores = [row[0] for row in c.fetchall()]
-
-        score_distribution = {
-            '0-4': 0,
-            '5-9': 0,
-            '10-14': 0,
-            '15-19': 0,
-            '20-24': 0,
-            '25-29': 0,
-            '30-34': 0,
-            '35-39': 0,
-            '40-44': 0,
-            '45-49': 0,
-            '50+': 0
+# THÊM: Aggregates bằng SQL (hot) + các session đã archive - dùng khi chưa load live state
+# hoặc khi lọc ?from=&to= (aggregates in-memory chỉ có all-time)
+def aggregate_stats(c, time_range=None):
+    if time_range is None:
+        archived_totals, archived_reasons, archived_buckets = load_archive_aggregates(c)
+        range_where, range_filter, params = '', '', ()
+    else:
+        # Aggregates archive không chia theo thời gian: quét file archive trong khoảng
+        archived_totals, archived_reasons, archived_buckets = summarize_sessions(
+            iter_archived_sessions(time_range=time_range))
+        range_where, range_filter = f'WHERE {RANGE_SQL}', f'AND {RANGE_SQL}'
+        params = range_params(time_range)
+
+    def merged(metric, hot_count, hot_avg, hot_max):
+        archived = archived_totals.get(metric, {'count': 0, 'total': 0, 'max': None})
+        count = hot_count + archived['count']
+        total = (hot_avg or 0) * hot_count + archived['total']
+        maxima = [v for v in (hot_max, archived['max']) if v is not None]
+        return (total / count if count else 0), (int(max(maxima)) if maxima else 0)
+
+    # Basic stats
+    c.execute(f'''
+        SELECT COUNT(*),
+               COUNT(score), AVG(score), MAX(score),
+               COUNT(game_duration), AVG(game_duration),
+               COUNT(bullets_fired), AVG(bullets_fired), MAX(bullets_fired)
+        FROM game_sessions
+        {range_where}
+    ''', params)
+    result = c.fetchone()
+    total_games = result[0] + archived_totals.get('games', {'count': 0})['count']
+    avg_score, max_score = merged('score', result[1], result[2], result[3])
+    avg_duration, _ = merged('game_duration', result[4], result[5], None)
+    avg_bullets, max_bullets = merged('bullets_fired', result[6], result[7], result[8])
+    
+    # Death reasons
+    c.execute(f'''
+        SELECT death_reason, COUNT(*) FROM game_sessions
+        WHERE death_reason IS NOT NULL {range_filter}
+        GROUP BY death_reason
+    ''', params)
+    death_reasons = dict(archived_reasons)
+    for reason, count in c.fetchall():
+        death_reasons[reason] = death_reasons.get(reason, 0) + count
+    
+    # Score distribution
+    score_distribution = {bucket: archived_buckets.get(bucket, 0) for bucket in SCORE_BUCKETS}
+    c.execute(f'SELECT score FROM game_sessions WHERE score IS NOT NULL {range_filter}', params)
+    for (score,) in c.fetchall():
+        score_distribution[score_bucket(score)] += 1
+    
+    return {
+        'total_games': total_games,
+        'avg_score': round(avg_score, 1),
+        'max_score': max_score,
+        'avg_duration': round(avg_duration, 1),
+        'avg_bullets': round(avg_bullets, 1),
+        'max_bullets': max_bullets,
+        'death_reasons': death_reasons,
+        'score_distribution': score_distribution
+    }
+
+# THÊM: Tính stats cho dashboard - aggregates lấy từ live state in-memory nếu đã load
+def collect_stats(conn, time_range=None):
+    c = conn.cursor()
+    if live_state.loaded and time_range is None:
+        summary = live_state.component('aggregates').summary()
+    else:
+        summary = aggregate_stats(c, time_range)
+
+    range_filter = '' if time_range is None else f'WHERE {RANGE_SQL}'
+    params = range_params(time_range) if time_range else ()
+
+    # Recent games
+    c.execute(f'''
+        SELECT score, coins_collected, ufos_shot, bullets_fired, game_duration, death_reason 
+        FROM game_sessions {range_filter}
+        ORDER BY end_ms DESC 
+        LIMIT 10
+    ''', params)
+    recent_games = [
+        {
+            'score': row[0],
+            'coins': row[1],
+            'ufos': row[2],
+            'bullets': row[3],
+            'duration': row[4],
+            'death_reason': row[5]
+        }
+        for row in c.fetchall()
+    ]
+    
+    # All games for scatter plots (chỉ cửa sổ hot - session đã archive không còn chi tiết)
+    c.execute(f'''
+        SELECT score, coins_collected, ufos_shot, bullets_fired, game_duration
+        FROM game_sessions {range_filter}
+    ''', params)
+    all_games = [
+        {
+            'score': row[0],
+            'coins': row[1],
+            'ufos': row[2],
+            'bullets': row[3],
+            'duration': row[4]
         }
+        for row in c.fetchall()
+    ]
+    
+    return {
+        **summary,
+        'recent_games': recent_games,
+        'all_games': all_games
+    }
 
-        for score in scores:
-            if score >= 50:
-                score_distribution['50+'] += 1
-            elif score >= 45:
-                score_distribution['45-49'] += 1
-            elif score >= 40:
-                score_distribution['40-44'] += 1
-            elif score >= 35:
-                score_distribution['35-39'] += 1
-            elif score >= 30:
-                score_distribution['30-34'] += 1
-            elif score >= 25:
-                score_distribution['25-29'] += 1
-            elif score >= 20:
-                score_distribution['20-24'] += 1
-            elif score >= 15:
-                score_distribution['15-19'] += 1
-            elif score >= 10:
-                score_distribution['10-14'] += 1
-            elif score >= 5:
-                score_distribution['5-9'] += 1
-            else:
-                score_distribution['0-4'] += 1
-        
-        # All games for scatter plots
-        c.execute('''
-            SELECT score, coins_collected, ufos_shot, bullets_fired, game_duration
-            FROM game_sessions
-        ''')
-        all_games = [
-            {
-                'score': row[0],
-                'coins': row[1],
-                'ufos': row[2],
-                'bullets': row[3],
-                'duration': row[4]
-            }
-            for row in c.fetchall()
-        ]
-        
-        # Bullets stats
-        c.execute('SELECT MAX(bullets_fired), AVG(bullets_fired) FROM game_sessions')
-        bullet_stats = c.fetchone()
-        max_bullets = bullet_stats[0] or 0
-        avg_bullets = round(bullet_stats[1] or 0, 1)
-        
+# THÊM: Generate complete stats data for static usage
+def generate_complete_stats(time_range=None):
+    try:
+        conn, lag = read_connection()
+        stats = collect_stats(conn, time_range)
         conn.close()
-        
-        return {
-            'total_games': total_games,
-            'avg_score': avg_score,
-            'max_score': max_score,
-            'avg_duration': avg_duration,
-            'avg_bullets': avg_bullets,
-            'max_bullets': max_bullets,
-            'death_reasons': death_reasons,
-            'recent_games': recent_games,
-            'score_distribution': score_distribution,
-            'all_games': all_games
-        }
+        return {**stats, **staleness_info(lag)}
         
     except Exception as e:
         print(f"Error generating stats: {e}")
@@ -327,20 +488,15 @@ def generate_complete_stats():
 @app.route('/api/export-stats')
 def export_stats():
     try:
-        stats_data = generate_complete_stats()
-        
-        # Tạo thư mục data nếu chưa tồn tại
-        os.makedirs('static/data', exist_ok=True)
+        stats_data = generate_complete_stats(parse_time_range(request.args))
         
-        # Export stats to JSON file
-        with open('static/data/stats.json', 'w', encoding='utf-8') as f:
-            json.dump({
-                **stats_data,
-                'last_updated': datetime.now().isoformat()
-            }, f, indent=2)
+        # stats.json nhỏ (không còn all_games) + scatter dạng chunk JSON và nhị phân theo cột
+        build_stats_artifacts({**stats_data, 'last_updated': datetime.now().isoformat()})
         
         return jsonify({'status': 'success', 'message': 'Stats exported successfully'})
         
+    except TimeRangeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         print(f"Error exporting stats: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -355,6 +511,18 @@ def generate_dashboard():
         # Tạo thư mục static nếu chưa tồn tại
         os.makedirs('static', exist_ok=True)
         
+        # Các dòng bảng recent games dựng trước (f-string lồng cùng dấu nháy cần Python 3.12)
+        recent_rows = "".join(f'''
+                    <tr>
+                        <td style="font-weight: bold; color: #2c3e50;">{game['score']}</td>
+                        <td>{game['coins']}</td>
+                        <td>{game['ufos']}</td>
+                        <td>{game['bullets']}</td>
+                        <td>{game['duration']}</td>
+                        <td>{(game['death_reason'] or 'unknown').replace('_', ' ')}</td>
+                    </tr>
+                    ''' for game in stats_data.get('recent_games', []))
+
         # HTML template với data nhúng sẵn
         html_content = f'''
 <!DOCTYPE html>
@@ -622,16 +790,7 @@ def generate_dashboard():
                     </tr>
                 </thead>
                 <tbody id="recentGamesBody">
-                    {"".join(f'''
-                    <tr>
-                        <td style="font-weight: bold; color: #2c3e50;">{game['score']}</td>
-                        <td>{game['coins']}</td>
-                        <td>{game['ufos']}</td>
-                        <td>{game['bullets']}</td>
-                        <td>{game['duration']}</td>
-                        <td>{(game['death_reason'] or 'unknown').replace('_', ' ')}</td>
-                    </tr>
-                    ''' for game in stats_data.get('recent_games', []))}
+                    {recent_rows}
                 </tbody>
             </table>
         </div>
@@ -815,125 +974,249 @@ def generate_dashboard():
 @app.route('/api/plane-stats')
 def get_plane_stats():
     try:
-        conn = sqlite3.connect('plane_analytics.db')
-        c = conn.cursor()
-        
-        # Basic stats - thêm avg_bullets
-        c.execute('SELECT COUNT(*), AVG(score), MAX(score), AVG(game_duration), AVG(bullets_fired) FROM game_sessions')
-        result = c.fetchone()
-        total_games = result[0] if result[0] else 0
-        avg_score = round(result[1] or 0, 1)
-        max_score = result[2] or 0
-        avg_duration = round(result[3] or 0, 1)
-        avg_bullets = round(result[4] or 0, 1)
-        
-        # Death reasons
-        c.execute('SELECT death_reason, COUNT(*) FROM game_sessions WHERE death_reason IS NOT NULL GROUP BY death_reason')
-        death_reasons = dict(c.fetchall())
+        time_range = parse_time_range(request.args)
+        conn, lag = read_connection()
+        stats = collect_stats(conn, time_range)
+        conn.close()
         
-        # Recent games - thêm bullets_fired
-        c.execute('''
-            SELECT score, coins_collected, ufos_shot, bullets_fired, game_duration, death_reason 
-            FROM game_sessions 
-            ORDER BY end_time DESC 
-            LIMIT 10
-        ''')
-        recent_games = [
-            {
-                'score': row[0],
-                'coins': row[1],
-                'ufos': row[2],
-                'bullets': row[3],
-                'duration': row[4],
-                'death_reason': row[5]
-            }
-            for row in c.fetchall()
-        ]
+        return jsonify({**stats, **staleness_info(lag)})
         
-        # Score distribution với buckets mới
-        c.execute('SELECT score FROM game_sessions')
-        scores = [row[0] for row in c.fetchall()]
-
-        score_distribution = {
-            '0-4': 0,
-            '5-9': 0,
-            '10-14': 0,
-            '15-19': 0,
-            '20-24': 0,
-            '25-29': 0,
-            '30-34': 0,
-            '35-39': 0,
-            '40-44': 0,
-            '45-49': 0,
-            '50+': 0
+    except TimeRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error retrieving stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# THÊM: Stats chung cho mọi game, dùng các câu SQL đã dựng sẵn trong GameSchema
+def collect_game_stats(conn, game, time_range=None):
+    c = conn.cursor()
+
+    row = c.execute(*game.sql('summary', time_range)).fetchone()
+    metrics = {
+        metric: {
+            'avg': round(row[1 + 2 * i] or 0, 1),
+            'max': row[2 + 2 * i] or 0
         }
+        for i, metric in enumerate(game.metrics)
+    }
 
-        # Count scores in each bucket
-        for score in scores:
-            if score >= 50:
-                score_distribution['50+'] += 1
-            elif score >= 45:
-                score_distribution['45-49'] += 1
-            elif score >= 40:
-                score_distribution['40-44'] += 1
-            elif score >= 35:
-                score_distribution['35-39'] += 1
-            elif score >= 30:
-                score_distribution['30-34'] += 1
-            elif score >= 25:
-                score_distribution['25-29'] += 1
-            elif score >= 20:
-                score_distribution['20-24'] += 1
-            elif score >= 15:
-                score_distribution['15-19'] += 1
-            elif score >= 10:
-                score_distribution['10-14'] += 1
-            elif score >= 5:
-                score_distribution['5-9'] += 1
-            else:
-                score_distribution['0-4'] += 1
-        
-        # Lấy tất cả games cho scatter plots - thêm bullets_fired
-        c.execute('''
-            SELECT score, coins_collected, ufos_shot, bullets_fired, game_duration
-            FROM game_sessions
-        ''')
-        all_games = [
-            {
-                'score': row[0],
-                'coins': row[1],
-                'ufos': row[2],
-                'bullets': row[3],
-                'duration': row[4]
-            }
-            for row in c.fetchall()
-        ]
-        
-        # Thêm stats về bullets
-        c.execute('SELECT MAX(bullets_fired), AVG(bullets_fired) FROM game_sessions')
-        bullet_stats = c.fetchone()
-        max_bullets = bullet_stats[0] or 0
-        avg_bullets = round(bullet_stats[1] or 0, 1)
-        
+    category_sql, params = game.sql('category', time_range)
+    categories = dict(c.execute(category_sql, params).fetchall()) if category_sql else {}
+
+    recent_games = [dict(zip(game.recent_columns, r)) for r in c.execute(*game.sql('recent', time_range)).fetchall()]
+
+    return {
+        'game': game.name,
+        'total_games': row[0],
+        'metrics': metrics,
+        'categories': categories,
+        'recent_games': recent_games
+    }
+
+@app.route('/api/games/<game_name>/stats')
+def get_game_stats(game_name):
+    game = get_game(game_name)
+    if game is None:
+        return jsonify({'error': f'Unknown game: {game_name}'}), 404
+
+    try:
+        time_range = parse_time_range(request.args)
+        conn, lag = read_connection()
+        stats = collect_game_stats(conn, game, time_range)
         conn.close()
-        
+
+        return jsonify({**stats, **staleness_info(lag)})
+
+    except TimeRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error retrieving {game_name} stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# THÊM: Bảng xếp hạng top N theo score / ufos_shot / pipes_passed, toàn thời gian hoặc theo ngày
+@app.route('/api/leaderboard')
+def get_leaderboard():
+    try:
+        metric = request.args.get('metric', 'score')
+        window = request.args.get('window', WINDOW_ALL)
+        limit = request.args.get('limit', 10, type=int)
+        time_range = parse_time_range(request.args)
+
+        if metric not in LEADERBOARD_METRICS:
+            return jsonify({'error': f'metric must be one of {LEADERBOARD_METRICS}'}), 400
+        if window == 'day':
+            window = request.args.get('day') or datetime.utcnow().strftime('%Y-%m-%d')
+        limit = max(1, min(limit, LEADERBOARD_SIZE))
+
+        # Live state luôn mới nhất (lag 0); dựng lại leaderboard cũng bắt kịp tới DB chính
+        lag = 0.0
+        if live_state.loaded and leaderboard.has_window(window) and time_range is None:
+            with live_state.lock:
+                stale = leaderboard.needs_rebuild(metric, window, limit)
+            if stale:
+                # Dựng lại ngoài lock (đọc replica), ingest không bị chặn trong lúc quét
+                conn, _ = read_connection()
+                live_state.rebuild_component(conn, leaderboard.name)
+                conn.close()
+            with live_state.lock:
+                entries = leaderboard.top(metric, window, limit)
+        else:
+            # Chưa load live state, ngày đã bị loại khỏi bộ nhớ hoặc có lọc ?from=&to=
+            conn, lag = read_connection()
+            entries = query_leaderboard(conn.cursor(), metric, window, limit, time_range)
+            conn.close()
+
         return jsonify({
-            'total_games': total_games,
-            'avg_score': avg_score,
-            'max_score': max_score,
-            'avg_duration': avg_duration,
-            'avg_bullets': avg_bullets,
-            'max_bullets': max_bullets,
-            'death_reasons': death_reasons,
-            'recent_games': recent_games,
-            'score_distribution': score_distribution,
-            'all_games': all_games  # Thêm dữ liệu cho scatter plots
+            'metric': metric,
+            'window': window,
+            'entries': [{'rank': i + 1, **entry} for i, entry in enumerate(entries)],
+            **staleness_info(lag)
         })
-        
+
+    except TimeRangeError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error retrieving stats: {e}")
+        print(f"Error retrieving leaderboard: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# THÊM: Đường cong sống sót theo game_duration / pipes_passed, có thể tách theo death_reason
+@app.route('/api/survival')
+def get_survival():
+    try:
+        metric = request.args.get('metric', 'game_duration')
+        split = request.args.get('split')
+        threshold = request.args.get('threshold', DEFAULT_THRESHOLD.get(metric), type=int)
+        time_range = parse_time_range(request.args)
+
+        if metric not in SURVIVAL_BINS:
+            return jsonify({'error': f'metric must be one of {list(SURVIVAL_BINS)}'}), 400
+
+        lag = 0.0
+        if live_state.loaded and time_range is None:
+            with live_state.lock:
+                response = build_survival_response(survival_curves, metric, split, threshold)
+        else:
+            conn, lag = read_connection()
+            curves = survival_from_db(conn.cursor(), metric, time_range)
+            conn.close()
+            response = build_survival_response(curves, metric, split, threshold)
+
+        return jsonify({**response, **staleness_info(lag)})
+
+    except TimeRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error retrieving survival curve: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# THÊM: Ma trận tương quan Pearson giữa score / coins / UFOs / bullets / duration / pipes
+@app.route('/api/correlations')
+def get_correlations():
+    try:
+        time_range = parse_time_range(request.args)
+
+        lag = 0.0
+        if live_state.loaded and time_range is None:
+            # O(1) theo số session: chỉ tính từ co-moment đã cập nhật lúc ingest
+            with live_state.lock:
+                response = correlations.result()
+        else:
+            conn, lag = read_connection()
+            response = correlations_from_db(conn.cursor(), time_range).result()
+            conn.close()
+
+        return jsonify({**response, **staleness_info(lag)})
+
+    except TimeRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error retrieving correlations: {e}")
         return jsonify({'error': str(e)}), 500
 
+def build_survival_response(curves, metric, split, threshold):
+    response = {
+        'metric': metric,
+        'bins': list(range(SURVIVAL_BINS[metric])),
+        'threshold': threshold,
+        **curves.curve(metric, ALL_REASONS, threshold)
+    }
+    if split == 'death_reason':
+        response['by_death_reason'] = {
+            reason: curves.curve(metric, reason, threshold) for reason in curves.reasons(metric)
+        }
+    return response
+
+# THÊM: Dự đoán score / khả năng sống sót > 30s cho các session đang chơi
+@app.route('/api/predict', methods=['POST', 'OPTIONS'])
+def predict():
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        started = time.perf_counter()
+        data = request.get_json()
+
+        if isinstance(data, list):
+            sessions = data
+        elif isinstance(data, dict):
+            sessions = data.get('sessions', [data])
+        else:
+            sessions = None
+        if not isinstance(sessions, list):
+            return jsonify({'status': 'error', 'message': 'Expected a session object or a list of sessions'}), 400
+
+        if not predictor.ready:
+            return jsonify({'status': 'error', 'message': 'No prediction model loaded'}), 503
+
+        try:
+            predictions = predictor.predict(sessions)
+        except SessionError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        return jsonify({
+            'status': 'success',
+            'predictions': predictions,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3)
+        })
+
+    except Exception as e:
+        print(f"Error predicting: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# THÊM: Profiling lúc runtime (admin, header X-Admin-Token) - GET xem tổng hợp, POST đổi cấu hình
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+@admin_required
+def admin_profiling():
+    if request.method == 'GET':
+        return jsonify(profiler.summary())
+
+    try:
+        settings = profiler.configure(request.get_json() or {})
+        return jsonify({'status': 'success', 'settings': settings})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+# THÊM: Ghi profile (.prof, .txt, .collapsed) và SQL timing ra thư mục profiles/
+@app.route('/api/admin/profiling/dump', methods=['POST'])
+@admin_required
+def admin_profiling_dump():
+    try:
+        return jsonify({'status': 'success', 'files': profiler.dump()})
+    except Exception as e:
+        print(f"Error dumping profiles: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/profiling/reset', methods=['POST'])
+@admin_required
+def admin_profiling_reset():
+    profiler.reset()
+    return jsonify({'status': 'success'})
+
+# THÊM: Số request ingest được nhận / bị từ chối - dùng để điều chỉnh capacity
+@app.route('/api/admission-stats')
+def admission_stats():
+    return jsonify(admission.stats())
+
 @app.route('/health')
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'plane-analytics'})
@@ -943,14 +1226,40 @@ def health_check():
 def serve_dashboard():
     return app.send_static_file('dashboard.html')
 
+# THÊM: Model, live state và các thread nền của process phục vụ request
+# (chạy bằng WSGI server thì gọi init_db() + start_services() khi khởi tạo app)
+def start_services():
+    global predictor
+    predictor = load_predictor()
+    load_state()
+    start_snapshotter()
+    start_archiver()
+    start_replica_refresher()
+    start_compactor()
+
 if __name__ == '__main__':
+    app.debug = os.environ.get('PLANE_DEBUG', '1') != '0'
     init_db()
+    # Debug mode bật reloader: __main__ chạy cả ở process cha (chỉ theo dõi file, không nhận request)
+    # và process con phục vụ request (WERKZEUG_RUN_MAIN=true) - không start gì ở process cha
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
     print("🚀 Plane Analytics Server starting on http://localhost:5000")
     print("💾 Data will be saved to plane_analytics.db")
     print("📊 New endpoints available:")
     print("   - /api/export-data     - Export raw data to JSON")
     print("   - /api/export-stats    - Export statistics to JSON") 
     print("   - /api/generate-dashboard - Generate static HTML dashboard")
+    print("   - /api/games/<game>/analytics - Ingest sessions for snake / ball / cat / plane")
+    print("   - /api/games/<game>/stats     - Per-game summary stats")
+    print("   - /api/games/<game>/events    - Ingest in-game event batches; GET .../events/<gameId> for a timeline")
+    print("   - /api/leaderboard     - Top N by score / UFOs / pipes, all-time or per day")
+    print("   - /api/survival        - Survival curves over duration / pipes passed")
+    print("   - /api/correlations    - Pearson correlation matrix over session metrics")
+    print("   - /api/predict         - Predict score / survival for sessions")
+    print("   - /api/admission-stats - Ingest admission / rejection counters")
+    print("   - /api/admin/profiling - Runtime cProfile / sampling profiler + SQL timings (X-Admin-Token)")
     print("   - /                    - View static dashboard")
+    print("   ℹ️  Read / export endpoints accept ?from=&to= (epoch ms or ISO 8601, by end time)")
     print("⚠️  Press Ctrl+C to stop server - data will be preserved")
-    app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
+    app.run(debug=app.debug, port=5000, host='0.0.0.0')
\ No newline at end of file
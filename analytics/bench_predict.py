@@ -0,0 +1,90 @@
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from predict_service import Predictor, load_model, SCORE_FEATURES, SURVIVAL_FEATURES, SCORE_MODEL_PATH, SURVIVAL_MODEL_PATH
+
+BATCH_SIZES = [1, 8, 32, 128]
+
+
+# Model thay thế khi chưa có file model - chỉ đo overhead của micro-batching
+class LinearModel:
+    def __init__(self, n_features):
+        self.weights = [random.random() for _ in range(n_features)]
+
+    def predict(self, matrix):
+        return [sum(w * x for w, x in zip(self.weights, row)) for row in matrix]
+
+
+def random_session():
+    duration = random.randint(1, 120)
+    bullets = random.randint(0, 80)
+    return {
+        'score': random.randint(0, 60),
+        'coinsCollected': random.randint(0, 30),
+        'ufosShot': random.randint(0, bullets),
+        'bulletsFired': bullets,
+        'gameDuration': duration,
+        'pipesPassed': random.randint(0, duration // 2)
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(predictor, batch_size, clients, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(requests_per_client):
+            sessions = [random_session() for _ in range(batch_size)]
+            started = time.perf_counter()
+            predictor.predict(sessions)
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'mean': statistics.mean(latencies),
+        'rps': len(latencies) / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/predict micro-batching latency')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    score_model = load_model(SCORE_MODEL_PATH) or LinearModel(len(SCORE_FEATURES))
+    survival_model = load_model(SURVIVAL_MODEL_PATH) or LinearModel(len(SURVIVAL_FEATURES))
+    predictor = Predictor(score_model, survival_model)
+
+    print(f"Models: {type(score_model).__name__} / {type(survival_model).__name__}")
+    print(f"{args.clients} concurrent clients x {args.requests} requests\n")
+    print(f"{'batch':>6} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'req/s':>9}")
+
+    for batch_size in BATCH_SIZES:
+        result = run(predictor, batch_size, args.clients, args.requests)
+        print(f"{batch_size:>6} {result['p50']:>9.3f} {result['p99']:>9.3f} {result['mean']:>9.3f} {result['rps']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
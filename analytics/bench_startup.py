@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import live_state
+from correlations import Correlations
+from game_registry import GAMES
+from leaderboard import Leaderboard
+from retention import init_archive_tables
+from survival import SurvivalCurves
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEATH_REASONS = ['pipe', 'ufo_collision', 'enemy_bullet', 'ground', 'ceiling']
+GAME = GAMES['plane']
+# Session trải đều trong khoảng này để leaderboard theo ngày có đủ các ngày như server thật
+SPREAD_DAYS = 60
+
+# Cùng các component với analytics_plane
+live_state.state.register(Leaderboard())
+live_state.state.register(SurvivalCurves())
+live_state.state.register(Correlations())
+
+
+def create_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(GAME.create_sql)
+    live_state.init_state_tables(conn.cursor())
+    init_archive_tables(conn.cursor())
+    insert_rows(conn, 0, rows)
+    conn.close()
+
+
+def insert_rows(conn, start, count):
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(start, start + count):
+        duration = random.randint(1, 120)
+        end = now - timedelta(seconds=random.randint(0, SPREAD_DAYS * 86400))
+        start_time = (end - timedelta(seconds=duration)).isoformat()
+        rows.append(GAME.normalize((
+            f'plane_{i}', start_time, end.isoformat(), random.randint(0, 80), random.randint(0, 40),
+            random.randint(0, 20), random.randint(0, 100), random.choice(DEATH_REASONS), duration,
+            random.randint(0, 60)
+        )))
+    conn.executemany(GAME.insert_sql, rows)
+    conn.commit()
+
+
+def time_import(module):
+    # Thời gian import trong process mới (bao gồm khởi động interpreter)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', f'import {module}'], cwd=HERE, capture_output=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed if result.returncode == 0 else None
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark analytics server cold start')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--new-rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'plane_analytics.db')
+        snapshot_path = os.path.join(tmp, 'state_snapshot.json.gz')
+        archive_dir = os.path.join(tmp, 'archive')
+        create_db(db_path, args.rows)
+        conn = sqlite3.connect(db_path)
+        state = live_state.state
+
+        rebuild_ms = timed(lambda: state.rebuild(conn, archive_dir))
+        save_ms = timed(lambda: state.save(conn, snapshot_path))
+        insert_rows(conn, args.rows, args.new_rows)
+        restore_ms = timed(lambda: state.restore(conn, snapshot_path))
+        conn.close()
+
+        print(f"{args.rows} rows in game_sessions, {args.new_rows} written after the snapshot\n")
+        print(f"  full rebuild (scan all rows)     {rebuild_ms:9.1f} ms")
+        print(f"  snapshot write                   {save_ms:9.1f} ms  ({os.path.getsize(snapshot_path)} bytes)")
+        print(f"  snapshot load + replay new rows  {restore_ms:9.1f} ms")
+
+    print()
+    for module in ('analytics_plane', 'export_csv'):
+        elapsed = time_import(module)
+        label = f'{elapsed:9.1f} ms' if elapsed is not None else '   failed'
+        print(f"  python -c 'import {module}'{' ' * (16 - len(module))}{label}")
+
+
+if __name__ == '__main__':
+    main()
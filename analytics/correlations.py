@@ -0,0 +1,176 @@
+import itertools
+import math
+
+from retention import ARCHIVE_DIR, iter_archived_sessions
+from timestamps import RANGE_SQL, range_params
+
+# Ma trận tương quan Pearson giữa các cột số của game_sessions, giữ bằng co-moment chạy
+# (n, mean, tổng tích chéo lệch) - cập nhật theo batch, gộp được giữa nhiều process
+CORRELATION_COLUMNS = ['score', 'coins_collected', 'ufos_shot', 'bullets_fired', 'game_duration', 'pipes_passed']
+CORRELATION_COLUMN_LIST = ', '.join(CORRELATION_COLUMNS)
+FALLBACK_BATCH = 5000
+
+
+class CoMoments:
+    def __init__(self, columns=CORRELATION_COLUMNS):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.n = 0
+        self.mean = [0.0] * k
+        # comoment[i][j] = Σ (x_i - mean_i)(x_j - mean_j)
+        self.comoment = [[0.0] * k for _ in range(k)]
+
+    @classmethod
+    def from_rows(cls, vectors, columns=CORRELATION_COLUMNS):
+        # Two-pass trên một batch nhỏ (ổn định số học), sau đó merge vào tổng
+        moments = cls(columns)
+        n = len(vectors)
+        if not n:
+            return moments
+        k = len(moments.columns)
+        mean = [sum(v[i] for v in vectors) / n for i in range(k)]
+        comoment = [[0.0] * k for _ in range(k)]
+        for v in vectors:
+            d = [v[i] - mean[i] for i in range(k)]
+            for i in range(k):
+                di = d[i]
+                row = comoment[i]
+                for j in range(i, k):
+                    row[j] += di * d[j]
+        for i in range(k):
+            for j in range(i):
+                comoment[i][j] = comoment[j][i]
+        moments.n, moments.mean, moments.comoment = n, mean, comoment
+        return moments
+
+    def merge(self, other, sign=1):
+        # Công thức gộp song song (Chan et al.); sign=-1 tách other ra khỏi tổng (row bị ghi đè)
+        if other.n == 0:
+            return self
+        k = len(self.columns)
+
+        if sign > 0:
+            n = self.n + other.n
+            delta = [other.mean[i] - self.mean[i] for i in range(k)]
+            factor = self.n * other.n / n
+            self.mean = [self.mean[i] + delta[i] * other.n / n for i in range(k)]
+            for i in range(k):
+                for j in range(k):
+                    self.comoment[i][j] += other.comoment[i][j] + delta[i] * delta[j] * factor
+            self.n = n
+            return self
+
+        n = self.n - other.n
+        if n <= 0:
+            self.__init__(self.columns)
+            return self
+        # mean phần còn lại A: n·mean = n_A·mean_A + n_B·mean_B
+        mean = [(self.n * self.mean[i] - other.n * other.mean[i]) / n for i in range(k)]
+        delta = [other.mean[i] - mean[i] for i in range(k)]
+        factor = n * other.n / self.n
+        for i in range(k):
+            for j in range(k):
+                self.comoment[i][j] -= other.comoment[i][j] + delta[i] * delta[j] * factor
+        self.n = n
+        self.mean = mean
+        return self
+
+    def pearson(self):
+        k = len(self.columns)
+        std = [math.sqrt(max(self.comoment[i][i], 0.0)) for i in range(k)]
+        matrix = []
+        for i in range(k):
+            row = []
+            for j in range(k):
+                if std[i] == 0 or std[j] == 0:
+                    row.append(None)
+                else:
+                    r = self.comoment[i][j] / (std[i] * std[j])
+                    row.append(round(max(-1.0, min(1.0, r)), 4))
+            matrix.append(row)
+        return matrix
+
+    def to_dict(self):
+        return {'columns': self.columns, 'n': self.n, 'mean': self.mean, 'comoment': self.comoment}
+
+    @classmethod
+    def from_dict(cls, data):
+        moments = cls(data['columns'])
+        moments.n = data['n']
+        moments.mean = list(data['mean'])
+        moments.comoment = [list(row) for row in data['comoment']]
+        return moments
+
+
+def session_vector(row, columns=CORRELATION_COLUMNS):
+    # Chỉ dùng session có đủ mọi cột (complete cases) để các cặp cùng một tập row
+    values = [row[column] for column in columns]
+    return None if any(value is None for value in values) else values
+
+
+class Correlations:
+    name = 'correlations'
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.moments = CoMoments()
+        self.skipped = 0
+
+    def apply_batch(self, rows, sign):
+        vectors = []
+        for row in rows:
+            vector = session_vector(row)
+            if vector is None:
+                self.skipped += sign
+            else:
+                vectors.append(vector)
+        self.moments.merge(CoMoments.from_rows(vectors), sign)
+
+    def apply(self, row, sign):
+        self.apply_batch([row], sign)
+
+    def result(self):
+        return correlation_response(self.moments, self.skipped)
+
+    def to_dict(self):
+        return {'moments': self.moments.to_dict(), 'skipped': self.skipped}
+
+    def load(self, data):
+        self.moments = CoMoments.from_dict(data['moments'])
+        self.skipped = data['skipped']
+
+
+def correlation_response(moments, skipped):
+    return {
+        'columns': moments.columns,
+        'n': moments.n,
+        'skipped_incomplete': skipped,
+        'means': {column: round(mean, 4) for column, mean in zip(moments.columns, moments.mean)},
+        'matrix': moments.pearson(),
+        # Trạng thái thô để process khác gộp bằng CoMoments.from_dict(...).merge(...)
+        'moments': moments.to_dict()
+    }
+
+
+def correlations_from_db(c, time_range=None, archive_dir=ARCHIVE_DIR):
+    # Khi chưa load live state hoặc có lọc ?from=&to=: quét game_sessions theo batch, cộng thêm
+    # các session đã archive trong khoảng (giống survival / leaderboard)
+    range_filter = '' if time_range is None else f'WHERE {RANGE_SQL}'
+    c.execute(f'SELECT {CORRELATION_COLUMN_LIST} FROM game_sessions {range_filter}',
+              range_params(time_range) if time_range else ())
+    correlations = Correlations()
+    while True:
+        batch = c.fetchmany(FALLBACK_BATCH)
+        if not batch:
+            break
+        correlations.apply_batch([dict(zip(CORRELATION_COLUMNS, row)) for row in batch], 1)
+
+    archived = iter_archived_sessions(archive_dir, time_range)
+    while True:
+        batch = list(itertools.islice(archived, FALLBACK_BATCH))
+        if not batch:
+            break
+        correlations.apply_batch(batch, 1)
+    return correlations
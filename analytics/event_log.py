@@ -0,0 +1,302 @@
+import glob
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: không có fcntl, khóa bằng msvcrt
+    fcntl = None
+    import msvcrt
+
+DB_FILE = 'plane_analytics.db'
+# Event chi tiết trong game (pipe, bullet, UFO, coin...) được ghi append-only vào
+# segment nhị phân, sau đó compactor chuyển segment đã đóng thành file cột + index theo gameId
+EVENTS_DIR = os.environ.get('PLANE_EVENTS_DIR', 'events')
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+SEGMENT_MAX_AGE_S = 60
+COMPACT_INTERVAL_S = 30
+MAX_EVENTS_PER_BATCH = 10000
+
+EVENT_TYPES = {
+    'pipe_passed': 1,
+    'bullet_fired': 2,
+    'ufo_hit': 3,
+    'coin_collected': 4,
+    'life_lost': 5,
+    'game_over': 6,
+    'food_eaten': 7,
+    'brick_broken': 8,
+    'power_up': 9,
+    'jump': 10,
+}
+EVENT_NAMES = {code: name for name, code in EVENT_TYPES.items()}
+
+# Header mỗi batch trong segment: độ dài gameId (u16), số event (u32)
+BATCH_HEADER = struct.Struct('<HI')
+MAX_U32 = 2 ** 32 - 1
+MIN_I32, MAX_I32 = -2 ** 31, 2 ** 31 - 1
+
+
+def parse_events(events):
+    # Trả về (list (t, type, value), lỗi hoặc None) - kiểm tra cả batch trước khi ghi
+    if not isinstance(events, list) or not 0 < len(events) <= MAX_EVENTS_PER_BATCH:
+        return None, 'events must be a non-empty list of at most %d items' % MAX_EVENTS_PER_BATCH
+
+    parsed = []
+    for event in events:
+        if not isinstance(event, dict):
+            return None, 'event must be an object'
+        t = event.get('t')
+        code = EVENT_TYPES.get(event.get('type'))
+        value = event.get('value', 0)
+        if code is None:
+            return None, f"unknown event type: {event.get('type')}"
+        if isinstance(t, bool) or not isinstance(t, int) or not 0 <= t <= MAX_U32:
+            return None, 't must be a non-negative integer (ms since game start)'
+        if isinstance(value, bool) or not isinstance(value, int) or not MIN_I32 <= value <= MAX_I32:
+            return None, 'value must be a 32-bit integer'
+        parsed.append((t, code, value))
+    return parsed, None
+
+
+def encode_batch(game_id, events):
+    key = game_id.encode('utf-8')
+    n = len(events)
+    ts, types, values = zip(*events) if events else ((), (), ())
+    return b''.join([
+        BATCH_HEADER.pack(len(key), n),
+        key,
+        struct.pack(f'<{n}I', *ts),
+        struct.pack(f'<{n}B', *types),
+        struct.pack(f'<{n}i', *values),
+    ])
+
+
+def decode_segment(data):
+    # Yield (game_id, ts, types, values); bỏ qua record cuối bị ghi dở (server crash)
+    offset = 0
+    while offset + BATCH_HEADER.size <= len(data):
+        key_len, n = BATCH_HEADER.unpack_from(data, offset)
+        end = offset + BATCH_HEADER.size + key_len + 9 * n
+        if end > len(data):
+            return
+        pos = offset + BATCH_HEADER.size
+        game_id = data[pos:pos + key_len].decode('utf-8')
+        pos += key_len
+        ts = struct.unpack_from(f'<{n}I', data, pos)
+        types = struct.unpack_from(f'<{n}B', data, pos + 4 * n)
+        values = struct.unpack_from(f'<{n}i', data, pos + 5 * n)
+        yield game_id, ts, types, values
+        offset = end
+
+
+def init_event_tables(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS event_index (
+            game TEXT,
+            game_id TEXT,
+            part INTEGER,
+            offset INTEGER,
+            count INTEGER,
+            PRIMARY KEY (game, game_id, part)
+        )
+    ''')
+
+
+class EventLog:
+    def __init__(self, game, root=EVENTS_DIR):
+        self.game = game
+        self.segment_dir = os.path.join(root, game, 'segments')
+        self.column_dir = os.path.join(root, game, 'columnar')
+        os.makedirs(self.segment_dir, exist_ok=True)
+        os.makedirs(self.column_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.compact_lock = threading.Lock()
+
+        # Lock file giữ suốt đời process: chỉ process giữ lock mới đóng segment .open còn sót
+        # và compact; process khác (vd. process cha của reloader) không đụng tới segment đang ghi
+        self.writer_lock = _lock_writer(os.path.join(self.segment_dir, 'writer.lock'))
+        if self.writer_lock is not None:
+            # Segment đang mở từ lần chạy trước được đóng lại để compact
+            for path in glob.glob(os.path.join(self.segment_dir, '*.open')):
+                os.replace(path, path[:-len('.open')] + '.sealed')
+        existing = [_seq(p) for p in glob.glob(os.path.join(self.segment_dir, '*.sealed'))]
+        existing += [_seq(p) for p in glob.glob(os.path.join(self.segment_dir, '*.open'))]
+        existing += [_seq(p) for p in glob.glob(os.path.join(self.column_dir, '*.col'))]
+        self.seq = max(existing, default=0)
+        self._open_segment()
+
+    def _open_segment(self):
+        self.seq += 1
+        self.path = os.path.join(self.segment_dir, f'{self.seq:08d}.open')
+        self.file = open(self.path, 'ab')
+        self.opened_at = time.time()
+        self.size = 0
+
+    def _seal(self):
+        # Đổi tên trước khi đóng file; đổi tên lỗi thì segment giữ nguyên .open (được đóng ở lần
+        # khởi động sau) và vẫn mở segment mới để append tiếp được
+        try:
+            os.replace(self.path, self.path[:-len('.open')] + '.sealed')
+        except OSError as e:
+            print(f"Error sealing event segment {self.path}: {e}")
+        self.file.close()
+        self._open_segment()
+
+    def append(self, game_id, events):
+        payload = encode_batch(game_id, events)
+        with self.lock:
+            # Một lần write cho cả batch, không có INSERT SQL nào cho từng event
+            self.file.write(payload)
+            self.file.flush()
+            self.size += len(payload)
+            if self.size >= SEGMENT_MAX_BYTES:
+                self._seal()
+
+    def seal_if_old(self):
+        with self.lock:
+            if self.size and time.time() - self.opened_at >= SEGMENT_MAX_AGE_S:
+                self._seal()
+
+    def compact(self, conn):
+        compacted = 0
+        if self.writer_lock is None:
+            return compacted
+        with self.compact_lock:
+            for path in sorted(glob.glob(os.path.join(self.segment_dir, '*.sealed'))):
+                part = _seq(path)
+                with open(path, 'rb') as f:
+                    data = f.read()
+
+                # Gom event theo gameId, sắp theo thời gian
+                grouped = {}
+                for game_id, ts, types, values in decode_segment(data):
+                    grouped.setdefault(game_id, []).extend(zip(ts, types, values))
+
+                # File cột: mỗi gameId một block [t u32 x n][type u8 x n][value i32 x n]
+                index_rows = []
+                offset = 0
+                part_path = os.path.join(self.column_dir, f'{part:08d}.col')
+                with open(part_path + '.tmp', 'wb') as f:
+                    for game_id, events in grouped.items():
+                        # Batch rỗng (segment ghi trước khi parse_events chặn) không có block nào
+                        if not events:
+                            continue
+                        events.sort()
+                        n = len(events)
+                        ts, types, values = zip(*events)
+                        f.write(struct.pack(f'<{n}I', *ts))
+                        f.write(struct.pack(f'<{n}B', *types))
+                        f.write(struct.pack(f'<{n}i', *values))
+                        index_rows.append((self.game, game_id, part, offset, n))
+                        offset += 9 * n
+                os.replace(part_path + '.tmp', part_path)
+
+                # Part number = số segment: compact lại sau crash không tạo trùng lặp
+                conn.execute('DELETE FROM event_index WHERE game = ? AND part = ?', (self.game, part))
+                conn.executemany('INSERT INTO event_index VALUES (?, ?, ?, ?, ?)', index_rows)
+                conn.commit()
+                os.remove(path)
+                compacted += 1
+        return compacted
+
+    def timeline(self, conn, game_id):
+        # Giữ compact_lock để segment không bị chuyển sang file cột giữa chừng
+        with self.compact_lock:
+            return self._timeline(conn, game_id)
+
+    def _timeline(self, conn, game_id):
+        events = []
+
+        # Dữ liệu đã compact: đọc đúng block của gameId qua index
+        rows = conn.execute('''
+            SELECT part, offset, count FROM event_index
+            WHERE game = ? AND game_id = ? ORDER BY part
+        ''', (self.game, game_id)).fetchall()
+        for part, offset, n in rows:
+            with open(os.path.join(self.column_dir, f'{part:08d}.col'), 'rb') as f:
+                f.seek(offset)
+                block = f.read(9 * n)
+            ts = struct.unpack_from(f'<{n}I', block, 0)
+            types = struct.unpack_from(f'<{n}B', block, 4 * n)
+            values = struct.unpack_from(f'<{n}i', block, 5 * n)
+            events.extend(zip(ts, types, values))
+
+        # Segment chưa compact (đang mở hoặc đã đóng): quét trực tiếp
+        with self.lock:
+            self.file.flush()
+            paths = sorted(glob.glob(os.path.join(self.segment_dir, '*.sealed'))) + [self.path]
+        compacted_parts = {part for part, _, _ in rows}
+        for path in paths:
+            if _seq(path) in compacted_parts:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            for batch_id, ts, types, values in decode_segment(data):
+                if batch_id == game_id:
+                    events.extend(zip(ts, types, values))
+
+        events.sort()
+        return [{'t': t, 'type': EVENT_NAMES.get(code, code), 'value': value} for t, code, value in events]
+
+
+def _lock_writer(path):
+    # Trả về file đang giữ lock (không đóng), hoặc None nếu process khác đang giữ
+    f = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _seq(path):
+    return int(os.path.basename(path).split('.')[0])
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_event_log(game):
+    with _logs_lock:
+        log = _logs.get(game)
+        if log is None:
+            log = _logs[game] = EventLog(game)
+        return log
+
+
+def compact_all(db_path=DB_FILE):
+    # Mọi game đã có thư mục event, kể cả segment còn sót từ lần chạy trước
+    games = os.listdir(EVENTS_DIR) if os.path.isdir(EVENTS_DIR) else []
+    conn = sqlite3.connect(db_path)
+    try:
+        compacted = 0
+        for game in games:
+            log = get_event_log(game)
+            log.seal_if_old()
+            compacted += log.compact(conn)
+        return compacted
+    finally:
+        conn.close()
+
+
+def start_compactor(db_path=DB_FILE, interval=COMPACT_INTERVAL_S):
+    def loop():
+        while not stop.wait(interval):
+            try:
+                compact_all(db_path)
+            except Exception as e:
+                print(f"Error compacting event segments: {e}")
+
+    stop = threading.Event()
+    threading.Thread(target=loop, daemon=True).start()
+    return stop
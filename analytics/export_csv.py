@@ -1,10 +1,14 @@
+import argparse
+import csv
 import sqlite3
-import pandas as pd
 import os
 
+from retention import ARCHIVE_DIR, iter_archived_sessions
+from timestamps import RANGE_SQL, parse_time_range, range_params
+
 DB_FILE = "plane_analytics.db"   # file .db của bạn
 
-def export_all_tables(db_path):
+def export_all_tables(db_path, time_range=None):
     # Kết nối DB
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -23,11 +27,31 @@ def export_all_tables(db_path):
     output_dir = "csv_export"
     os.makedirs(output_dir, exist_ok=True)
 
-    # Xuất từng bảng
+    # Xuất từng bảng - ghi trực tiếp bằng csv (không cần load pandas cho export nhỏ)
     for table in tables:
-        df = pd.read_sql(f"SELECT * FROM {table}", conn)
+        # Bảng session có end_ms: lọc --from/--to bằng range scan trên index
+        has_end_ms = "end_ms" in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if time_range is not None and has_end_ms:
+            cursor.execute(f"SELECT * FROM {table} WHERE {RANGE_SQL}", range_params(time_range))
+        else:
+            cursor.execute(f"SELECT * FROM {table}")
+        columns = [d[0] for d in cursor.description]
         csv_path = os.path.join(output_dir, f"{table}.csv")
-        df.to_csv(csv_path, index=False, encoding="utf-8-sig")
+
+        with open(csv_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+
+            # game_sessions: gộp thêm các session đã archive (bản trong DB được ưu tiên)
+            if table == "game_sessions":
+                hot_ids = {row[0] for row in conn.execute("SELECT id FROM game_sessions")}
+                archived = {}
+                for record in iter_archived_sessions(ARCHIVE_DIR, time_range):
+                    if record["id"] not in hot_ids:
+                        archived[record["id"]] = [record.get(column) for column in columns]
+                writer.writerows(archived.values())
+
+            writer.writerows(cursor)
 
         print(f"✔ Đã xuất {table} → {csv_path}")
 
@@ -36,4 +60,9 @@ def export_all_tables(db_path):
 
     
 if __name__ == "__main__":
-    export_all_tables(DB_FILE)
+    parser = argparse.ArgumentParser(description="Export analytics tables to CSV")
+    parser.add_argument("--from", dest="start", help="epoch ms hoặc ISO 8601 (theo end_time)")
+    parser.add_argument("--to", dest="end", help="epoch ms hoặc ISO 8601, không tính mốc này")
+    args = parser.parse_args()
+
+    export_all_tables(DB_FILE, parse_time_range({"from": args.start, "to": args.end}))
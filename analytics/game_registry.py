@@ -0,0 +1,134 @@
+from ingest_validation import MAX_COUNT, MAX_DURATION, MAX_TEXT_LENGTH, SESSION_SCHEMA, compile_schema
+from timestamps import EPOCH_COLUMNS, RANGE_SQL, range_params, to_epoch_ms
+
+# Các field chung cho mọi game
+COMMON_FIELDS = [
+    ('gameId', 'id', 'text', True, 1, 128),
+    ('startTime', 'start_time', 'text', False, 0, MAX_TEXT_LENGTH),
+    ('endTime', 'end_time', 'text', False, 0, MAX_TEXT_LENGTH),
+    ('score', 'score', 'int', False, 0, MAX_COUNT),
+    ('gameDuration', 'game_duration', 'int', False, 0, MAX_DURATION),
+]
+
+RECENT_GAMES_LIMIT = 10
+
+
+def _where(*conditions):
+    conditions = [condition for condition in conditions if condition]
+    return 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+
+class GameSchema:
+    # Mọi câu SQL được dựng một lần khi đăng ký game, request chỉ việc execute
+    def __init__(self, name, table, fields, metrics, category=None):
+        self.name = name
+        self.table = table
+        self.fields = fields
+        self.metrics = metrics
+        self.category = category
+        self.checkers = compile_schema(fields)
+        self.columns = [column for _, column, _, _, _, _ in fields]
+        # Vị trí start_time / end_time trong row đã validate, để thêm cột epoch ms khi ingest
+        self.time_indexes = [self.columns.index(text_column) for text_column, _ in EPOCH_COLUMNS]
+        insert_columns = self.columns + [ms_column for _, ms_column in EPOCH_COLUMNS]
+
+        column_list = ', '.join(insert_columns)
+        placeholders = ', '.join('?' * len(insert_columns))
+        column_defs = ',\n            '.join(
+            f'{column} TEXT PRIMARY KEY' if column == 'id' else f'{column} {"INTEGER" if kind == "int" else "TEXT"}'
+            for _, column, kind, _, _, _ in fields
+        )
+
+        self.create_sql = f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            {column_defs},
+            start_ms INTEGER,
+            end_ms INTEGER,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        '''
+        # received_at ghi tường minh: bảng cũ được migrate thêm cột này không có DEFAULT
+        self.insert_sql = (
+            f'INSERT OR REPLACE INTO {table} ({column_list}, received_at) VALUES ({placeholders}, CURRENT_TIMESTAMP)'
+        )
+
+        aggregates = ', '.join(f'AVG({m}), MAX({m})' for m in metrics)
+        self.recent_columns = [c for c in self.columns if c != 'start_time']
+        recent_list = ', '.join(self.recent_columns)
+
+        # Mỗi câu đọc có hai bản: toàn bộ và lọc ?from=&to= (range scan trên index end_ms)
+        self.queries = {}
+        for ranged in (False, True):
+            time_filter = RANGE_SQL if ranged else None
+            self.queries[ranged] = {
+                'summary': f'SELECT COUNT(*), {aggregates} FROM {table} {_where(time_filter)}',
+                'category': (
+                    f'''SELECT {category}, COUNT(*) FROM {table}
+                        {_where(f'{category} IS NOT NULL', time_filter)} GROUP BY {category}'''
+                    if category else None
+                ),
+                'recent': f'''
+                    SELECT {recent_list} FROM {table} {_where(time_filter)}
+                    ORDER BY end_ms DESC LIMIT {RECENT_GAMES_LIMIT}
+                ''',
+            }
+
+    def sql(self, name, time_range=None):
+        # Trả về (câu SQL, params) cho truy vấn đọc, có hoặc không lọc theo thời gian
+        if time_range is None:
+            return self.queries[False][name], ()
+        return self.queries[True][name], range_params(time_range)
+
+    def normalize(self, row):
+        # Thêm start_ms, end_ms vào row đã validate - parse timestamp đúng một lần lúc ingest
+        return row + tuple(to_epoch_ms(row[i]) for i in self.time_indexes)
+
+
+GAMES = {}
+
+
+def register_game(name, table, fields, metrics, category=None):
+    GAMES[name] = GameSchema(name, table, fields, metrics, category)
+    return GAMES[name]
+
+
+def get_game(name):
+    return GAMES.get(name)
+
+
+# Flappy Plane giữ bảng game_sessions có sẵn
+register_game(
+    'plane', 'game_sessions', SESSION_SCHEMA,
+    metrics=['score', 'coins_collected', 'ufos_shot', 'bullets_fired', 'game_duration', 'pipes_passed'],
+    category='death_reason'
+)
+
+register_game(
+    'snake', 'snake_sessions',
+    COMMON_FIELDS + [
+        ('snakeLength', 'snake_length', 'int', False, 0, MAX_COUNT),
+        ('obstacles', 'obstacles', 'int', False, 0, MAX_COUNT),
+        ('powerUpsCollected', 'power_ups_collected', 'int', False, 0, MAX_COUNT),
+        ('deathReason', 'death_reason', 'text', False, 0, MAX_TEXT_LENGTH),
+    ],
+    metrics=['score', 'snake_length', 'power_ups_collected', 'game_duration'],
+    category='death_reason'
+)
+
+register_game(
+    'ball', 'ball_sessions',
+    COMMON_FIELDS + [
+        ('level', 'level', 'int', False, 0, MAX_COUNT),
+        ('bricksBroken', 'bricks_broken', 'int', False, 0, MAX_COUNT),
+        ('powerUpsCollected', 'power_ups_collected', 'int', False, 0, MAX_COUNT),
+    ],
+    metrics=['score', 'level', 'bricks_broken', 'power_ups_collected', 'game_duration']
+)
+
+register_game(
+    'cat', 'cat_sessions',
+    COMMON_FIELDS + [
+        ('jumps', 'jumps', 'int', False, 0, MAX_COUNT),
+    ],
+    metrics=['score', 'jumps', 'game_duration']
+)
@@ -0,0 +1,99 @@
+import json
+
+# Mã lý do khi một row bị đưa vào quarantine_sessions
+REASON_NOT_OBJECT = 'not_object'
+REASON_MISSING_FIELD = 'missing_field'
+REASON_BAD_TYPE = 'bad_type'
+REASON_OUT_OF_RANGE = 'out_of_range'
+
+MAX_COUNT = 1_000_000
+MAX_DURATION = 24 * 60 * 60
+MAX_TEXT_LENGTH = 64
+
+# Schema của payload plane.html: field client -> (cột DB, kiểu, bắt buộc, min, max)
+SESSION_SCHEMA = [
+    ('gameId', 'id', 'text', True, 1, 128),
+    ('startTime', 'start_time', 'text', False, 0, MAX_TEXT_LENGTH),
+    ('endTime', 'end_time', 'text', False, 0, MAX_TEXT_LENGTH),
+    ('score', 'score', 'int', False, 0, MAX_COUNT),
+    ('coinsCollected', 'coins_collected', 'int', False, 0, MAX_COUNT),
+    ('ufosShot', 'ufos_shot', 'int', False, 0, MAX_COUNT),
+    ('bulletsFired', 'bullets_fired', 'int', False, 0, MAX_COUNT),
+    ('deathReason', 'death_reason', 'text', False, 0, MAX_TEXT_LENGTH),
+    ('gameDuration', 'game_duration', 'int', False, 0, MAX_DURATION),
+    ('pipesPassed', 'pipes_passed', 'int', False, 0, MAX_COUNT),
+]
+
+
+def _text_checker(field, required, min_len, max_len):
+    def check(value):
+        if value is None:
+            return (REASON_MISSING_FIELD, field) if required else None
+        if not isinstance(value, str):
+            return REASON_BAD_TYPE, field
+        if not min_len <= len(value) <= max_len:
+            return REASON_OUT_OF_RANGE, field
+        return None
+    return check
+
+
+def _int_checker(field, required, min_value, max_value):
+    def check(value):
+        if value is None:
+            return (REASON_MISSING_FIELD, field) if required else None
+        # bool là subclass của int - không chấp nhận
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return REASON_BAD_TYPE, field
+        if isinstance(value, float) and not value.is_integer():
+            return REASON_BAD_TYPE, field
+        if not min_value <= value <= max_value:
+            return REASON_OUT_OF_RANGE, field
+        return None
+    return check
+
+
+def compile_schema(schema):
+    # Compile một lần: mỗi field thành (key, checker) để validate không phải parse lại schema
+    checkers = []
+    for field, _, kind, required, low, high in schema:
+        factory = _int_checker if kind == 'int' else _text_checker
+        checkers.append((field, kind, factory(field, required, low, high)))
+    return checkers
+
+
+_SESSION_CHECKERS = compile_schema(SESSION_SCHEMA)
+
+
+def validate_batch(payloads, checkers=_SESSION_CHECKERS):
+    # Trả về (rows hợp lệ dạng tuple theo thứ tự cột của schema, rows bị loại để ghi quarantine)
+    valid = []
+    rejected = []
+
+    for payload in payloads:
+        if not isinstance(payload, dict):
+            rejected.append((None, REASON_NOT_OBJECT, type(payload).__name__, _dump(payload)))
+            continue
+
+        row = []
+        error = None
+        for field, kind, check in checkers:
+            value = payload.get(field)
+            error = check(value)
+            if error:
+                break
+            row.append(int(value) if kind == 'int' and value is not None else value)
+
+        if error:
+            game_id = payload.get('gameId')
+            rejected.append((game_id if isinstance(game_id, str) else None, error[0], error[1], _dump(payload)))
+        else:
+            valid.append(tuple(row))
+
+    return valid, rejected
+
+
+def _dump(payload):
+    try:
+        return json.dumps(payload)[:4096]
+    except (TypeError, ValueError):
+        return repr(payload)[:4096]
@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import os
+
+from retention import ARCHIVE_DIR, iter_archived_sessions
+from timestamps import day_range, ms_day, range_params, to_epoch_ms
+
+# Bảng xếp hạng top-K, cập nhật O(log K) mỗi row ingest
+LEADERBOARD_SIZE = int(os.environ.get('PLANE_LEADERBOARD_SIZE', 100))
+# Giữ thêm entry dự phòng để row bị ghi đè không làm thiếu top-K
+HEAP_CAPACITY = LEADERBOARD_SIZE * 2
+# Số ngày gần nhất có leaderboard theo ngày trong bộ nhớ
+MAX_DAYS = 31
+
+METRICS = ['score', 'ufos_shot', 'pipes_passed']
+WINDOW_ALL = 'all'
+
+
+def session_day(row):
+    # Ngày UTC theo end_ms (cùng cột với bộ lọc SQL); row từ live state chỉ có end_time
+    end_ms = row.get('end_ms')
+    if end_ms is None:
+        end_ms = to_epoch_ms(row.get('end_time'))
+    return ms_day(end_ms)
+
+
+class TopK:
+    def __init__(self, capacity=HEAP_CAPACITY):
+        self.capacity = capacity
+        # Min-heap (value, game_id): phần tử nhỏ nhất ở heap[0] bị loại khi đầy
+        self.heap = []
+        self.members = {}
+        # Entry lớn nhất từng bị loại: mọi entry trong heap luôn lớn hơn floor
+        self.floor = None
+
+    def push(self, game_id, value):
+        if game_id in self.members:
+            self.remove(game_id)
+        entry = (value, game_id)
+        if self.floor is not None and entry <= self.floor:
+            # Nhỏ hơn một entry đã bị loại - không thể nằm trong top-K hiện biết
+            return
+        if len(self.heap) < self.capacity:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            dropped = heapq.heapreplace(self.heap, entry)
+            del self.members[dropped[1]]
+            self.floor = dropped
+        else:
+            self.floor = entry
+            return
+        self.members[game_id] = value
+
+    def remove(self, game_id):
+        value = self.members.pop(game_id, None)
+        if value is None:
+            return
+        self.heap.remove((value, game_id))
+        heapq.heapify(self.heap)
+
+    def complete(self, limit):
+        # Top-limit chính xác khi heap còn đủ entry hoặc chưa từng loại entry nào
+        return len(self.heap) >= limit or self.floor is None
+
+    def top(self, limit):
+        return heapq.nlargest(limit, self.heap)
+
+
+class Leaderboard:
+    name = 'leaderboard'
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.boards = {}
+        self.days = set()
+
+    def _board(self, metric, window, create=True):
+        key = (metric, window)
+        board = self.boards.get(key)
+        if board is None and create:
+            board = self.boards[key] = TopK()
+        return board
+
+    def apply(self, row, sign):
+        game_id = row['id']
+        day = session_day(row)
+        windows = [WINDOW_ALL] if day is None else [WINDOW_ALL, day]
+
+        for metric in METRICS:
+            value = row[metric]
+            if value is None:
+                continue
+            for window in windows:
+                if sign > 0:
+                    self._board(metric, window).push(game_id, value)
+                else:
+                    board = self._board(metric, window, create=False)
+                    if board is not None:
+                        board.remove(game_id)
+
+        if day is not None and sign > 0 and day not in self.days:
+            self.days.add(day)
+            if len(self.days) > MAX_DAYS:
+                self._prune_days()
+
+    def _prune_days(self):
+        for day in sorted(self.days)[:-MAX_DAYS]:
+            self.days.discard(day)
+            for metric in METRICS:
+                self.boards.pop((metric, day), None)
+
+    def has_window(self, window):
+        return window == WINDOW_ALL or window in self.days
+
+    def needs_rebuild(self, metric, window, limit):
+        board = self._board(metric, window, create=False)
+        return board is not None and not board.complete(limit)
+
+    def top(self, metric, window, limit):
+        board = self._board(metric, window, create=False)
+        if board is None:
+            return []
+        return [{'gameId': game_id, 'value': value} for value, game_id in board.top(limit)]
+
+    def to_dict(self):
+        return {
+            f'{metric}|{window}': {'entries': board.heap, 'floor': board.floor}
+            for (metric, window), board in self.boards.items()
+        }
+
+    def load(self, data):
+        self.boards = {}
+        self.days = set()
+        for key, saved in data.items():
+            metric, window = key.split('|', 1)
+            board = TopK()
+            board.heap = [tuple(entry) for entry in saved['entries']]
+            heapq.heapify(board.heap)
+            board.members = {game_id: value for value, game_id in board.heap}
+            board.floor = tuple(saved['floor']) if saved['floor'] else None
+            self.boards[(metric, window)] = board
+            if window != WINDOW_ALL:
+                self.days.add(window)
+
+
+def query_leaderboard(c, metric, window, limit, time_range=None, archive_dir=ARCHIVE_DIR):
+    # Đọc thẳng từ game_sessions + các session đã archive khi không dùng được heap in-memory
+    day_filter = '' if window == WINDOW_ALL else 'AND end_ms >= :day_start AND end_ms < :day_end'
+    range_filter = '' if time_range is None else 'AND end_ms >= :start AND end_ms < :end'
+    day_start, day_end = (None, None) if window == WINDOW_ALL else day_range(window)
+    start, end = range_params(time_range) if time_range else (None, None)
+    c.execute(f'''
+        SELECT id, {metric} FROM game_sessions
+        WHERE {metric} IS NOT NULL {day_filter} {range_filter}
+        ORDER BY {metric} DESC, id DESC
+        LIMIT :limit
+    ''', {'day_start': day_start, 'day_end': day_end, 'start': start, 'end': end, 'limit': limit})
+    hot = [(value, game_id) for game_id, value in c.fetchall()]
+
+    # Archive không có index: quét file trong khoảng, cùng điều kiện ngày với live state
+    archived = (
+        (row[metric], row['id']) for row in iter_archived_sessions(archive_dir, time_range)
+        if row[metric] is not None and (window == WINDOW_ALL or session_day(row) == window)
+    )
+    top = heapq.nlargest(limit, itertools.chain(hot, archived))
+    return [{'gameId': game_id, 'value': value} for value, game_id in top]
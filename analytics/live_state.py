@@ -0,0 +1,375 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from retention import ARCHIVE_DIR, SCORE_BUCKETS, iter_archived_sessions, score_bucket
+
+DB_FILE = 'plane_analytics.db'
+
+# Snapshot trạng thái in-memory để khởi động nhanh, không phải quét lại game_sessions
+SNAPSHOT_FILE = os.environ.get('PLANE_STATE_SNAPSHOT', 'state_snapshot.json.gz')
+SNAPSHOT_INTERVAL_S = int(os.environ.get('PLANE_SNAPSHOT_INTERVAL', 300))
+SNAPSHOT_VERSION = 2
+
+ROW_COLUMNS = [
+    'id', 'start_time', 'end_time', 'score', 'coins_collected', 'ufos_shot',
+    'bullets_fired', 'death_reason', 'game_duration', 'pipes_passed'
+]
+ROW_COLUMN_LIST = ', '.join(ROW_COLUMNS)
+ROW_PLACEHOLDERS = ', '.join('?' * len(ROW_COLUMNS))
+TEXT_COLUMNS = {'id', 'start_time', 'end_time', 'death_reason'}
+
+# Các metric cần AVG / MAX trong stats endpoints
+AVG_METRICS = ['score', 'game_duration', 'bullets_fired']
+MAX_METRICS = ['score', 'bullets_fired']
+
+REPLAY_BATCH = 5000
+
+
+class SessionAggregates:
+    name = 'aggregates'
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.games = 0
+        self.counts = {m: 0 for m in AVG_METRICS}
+        self.sums = {m: 0 for m in AVG_METRICS}
+        # Histogram chính xác value -> count, để MAX vẫn đúng khi row bị replace
+        self.histograms = {m: {} for m in MAX_METRICS}
+        self.death_reasons = {}
+        self.score_buckets = {bucket: 0 for bucket in SCORE_BUCKETS}
+
+    def apply(self, row, sign):
+        self.games += sign
+        for metric in AVG_METRICS:
+            value = row[metric]
+            if value is not None:
+                self.counts[metric] += sign
+                self.sums[metric] += sign * value
+        for metric in MAX_METRICS:
+            value = row[metric]
+            if value is not None:
+                _bump(self.histograms[metric], value, sign)
+        if row['death_reason'] is not None:
+            _bump(self.death_reasons, row['death_reason'], sign)
+        if row['score'] is not None:
+            self.score_buckets[score_bucket(row['score'])] += sign
+
+    def summary(self):
+        def avg(metric):
+            count = self.counts[metric]
+            return round(self.sums[metric] / count, 1) if count else 0
+
+        return {
+            'total_games': self.games,
+            'avg_score': avg('score'),
+            'max_score': max(self.histograms['score'], default=0),
+            'avg_duration': avg('game_duration'),
+            'avg_bullets': avg('bullets_fired'),
+            'max_bullets': max(self.histograms['bullets_fired'], default=0),
+            'death_reasons': dict(self.death_reasons),
+            'score_distribution': dict(self.score_buckets)
+        }
+
+    def to_dict(self):
+        return {
+            'games': self.games,
+            'counts': self.counts,
+            'sums': self.sums,
+            'histograms': {m: list(h.items()) for m, h in self.histograms.items()},
+            'death_reasons': self.death_reasons,
+            'score_buckets': self.score_buckets
+        }
+
+    def load(self, data):
+        self.games = data['games']
+        self.counts = data['counts']
+        self.sums = data['sums']
+        self.histograms = {m: dict((value, count) for value, count in pairs) for m, pairs in data['histograms'].items()}
+        self.death_reasons = data['death_reasons']
+        self.score_buckets = data['score_buckets']
+
+
+def _bump(counter, key, sign):
+    count = counter.get(key, 0) + sign
+    if count > 0:
+        counter[key] = count
+    else:
+        counter.pop(key, None)
+
+
+class LiveState:
+    def __init__(self):
+        # Giữ lock khi ghi DB + apply để snapshot luôn khớp với last_rowid
+        self.lock = threading.RLock()
+        # Chỉ một lần dựng lại component tại một thời điểm (dựng ngoài self.lock)
+        self.rebuild_lock = threading.Lock()
+        self.components = {}
+        self.loaded = False
+        # rowid / replaced_sessions.seq lớn nhất mà state của process này đã apply
+        self.last_rowid = 0
+        self.replaced_seq = 0
+        self.archived_games = 0
+
+    def register(self, component):
+        self.components[component.name] = component
+        return component
+
+    def component(self, name):
+        return self.components[name]
+
+    def apply(self, rows, sign=1):
+        with self.lock:
+            # Theo từng batch: component có apply_batch (vd. correlations) nhận cả batch một lần
+            for batch in _batches(rows, REPLAY_BATCH):
+                for component in self.components.values():
+                    _apply_to(component, batch, sign)
+
+    def capture_replaced(self, c, game_ids):
+        # Lưu các row sắp bị INSERT OR REPLACE ghi đè để trừ khỏi state (cả khi replay lúc khởi động)
+        replaced = []
+        for i in range(0, len(game_ids), 500):
+            chunk = game_ids[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            c.execute(f'''
+                SELECT rowid, {ROW_COLUMN_LIST} FROM game_sessions
+                WHERE id IN ({placeholders})
+            ''', chunk)
+            replaced.extend(c.fetchall())
+
+        if replaced:
+            c.executemany(f'''
+                INSERT INTO replaced_sessions (old_rowid, {ROW_COLUMN_LIST})
+                VALUES (?, {ROW_PLACEHOLDERS})
+            ''', replaced)
+        return [dict(zip(ROW_COLUMNS, row[1:])) for row in replaced]
+
+    def written_marks(self, c):
+        # Gọi sau khi ghi, trước commit (write lock còn giữ): rowid / seq lớn nhất là của batch vừa ghi
+        rowid = c.execute('SELECT COALESCE(MAX(rowid), 0) FROM game_sessions').fetchone()[0]
+        seq = c.execute('SELECT COALESCE(MAX(seq), 0) FROM replaced_sessions').fetchone()[0]
+        return rowid, seq
+
+    def advance(self, marks):
+        # Chỉ cập nhật khi batch đã thật sự được apply vào state in-memory. rowid của game_sessions
+        # không AUTOINCREMENT: archive xóa hết row thì rowid mới bắt đầu lại từ thấp, nên mốc là
+        # rowid lớn nhất hiện có (của batch vừa ghi), không lấy max với mốc cũ
+        rowid, seq = marks
+        with self.lock:
+            self.last_rowid = rowid
+            self.replaced_seq = max(self.replaced_seq, seq)
+
+    def rebuild(self, conn, archive_dir=ARCHIVE_DIR):
+        with self.lock:
+            for component in self.components.values():
+                component.reset()
+            self.apply(iter_archived_sessions(archive_dir))
+            self.last_rowid = 0
+            self._replay(conn)
+            # Các row trong replaced_sessions không còn trong game_sessions nên không được replay
+            self.replaced_seq = _max_replaced_seq(conn)
+            self.archived_games = _archived_games(conn)
+            self.loaded = True
+
+    def rebuild_component(self, conn, name, db_path=DB_FILE, archive_dir=ARCHIVE_DIR):
+        # Dựng lại một component từ archive + game_sessions (vd. khi heap top-K bị thiếu).
+        # Quét ngoài lock vào bản mới (conn có thể là read replica) để không chặn ingest,
+        # chỉ giữ lock khi bắt kịp các row ghi sau lần quét rồi thay vào component đang dùng
+        component = self.components[name]
+        with self.rebuild_lock:
+            fresh = type(component)()
+            for batch in _batches(iter_archived_sessions(archive_dir), REPLAY_BATCH):
+                _apply_to(fresh, batch, 1)
+            read_rowid = self._scan_into(fresh, conn, 0)
+
+            with self.lock:
+                # Row mới hơn bản đã quét (replica trễ / ingest trong lúc quét), tới mốc đã apply;
+                # row ghi đè một gameId đã quét thay entry cũ (TopK.push theo gameId)
+                if self.last_rowid > read_rowid:
+                    primary = sqlite3.connect(db_path)
+                    try:
+                        self._scan_into(fresh, primary, read_rowid, self.last_rowid)
+                    finally:
+                        primary.close()
+                component.reset()
+                component.load(fresh.to_dict())
+
+    def _scan_into(self, component, conn, after_rowid, until_rowid=None):
+        # Apply các row rowid > after_rowid (<= until_rowid) vào component; trả về rowid lớn nhất đã đọc
+        c = conn.cursor()
+        upper = '' if until_rowid is None else 'AND rowid <= ?'
+        c.execute(f'''
+            SELECT rowid, {ROW_COLUMN_LIST} FROM game_sessions
+            WHERE rowid > ? {upper} ORDER BY rowid
+        ''', (after_rowid,) if until_rowid is None else (after_rowid, until_rowid))
+        last = after_rowid
+        while True:
+            batch = c.fetchmany(REPLAY_BATCH)
+            if not batch:
+                return last
+            _apply_to(component, [dict(zip(ROW_COLUMNS, row[1:])) for row in batch], 1)
+            last = batch[-1][0]
+
+    def _replay(self, conn):
+        c = conn.cursor()
+        while True:
+            c.execute(f'''
+                SELECT rowid, {ROW_COLUMN_LIST} FROM game_sessions
+                WHERE rowid > ? ORDER BY rowid LIMIT ?
+            ''', (self.last_rowid, REPLAY_BATCH))
+            batch = c.fetchall()
+            if not batch:
+                return
+            self.apply(dict(zip(ROW_COLUMNS, row[1:])) for row in batch)
+            self.last_rowid = batch[-1][0]
+
+    def restore(self, conn, path=SNAPSHOT_FILE):
+        # Trả về số row được replay, hoặc None nếu phải rebuild toàn bộ
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            snapshot = json.load(f)
+
+        if snapshot.get('version') != SNAPSHOT_VERSION or set(snapshot['components']) != set(self.components):
+            return None
+        # Có session bị archive sau snapshot: có thể đã mất row chưa được replay
+        if snapshot['archived_games'] != _archived_games(conn):
+            return None
+        # rowid đã bị dùng lại (bảng bị xóa hết sau mốc): row mới có thể nằm dưới last_rowid
+        if _max_rowid(conn) < snapshot['last_rowid']:
+            return None
+
+        with self.lock:
+            for name, data in snapshot['components'].items():
+                self.components[name].reset()
+                self.components[name].load(data)
+            self.last_rowid = snapshot['last_rowid']
+            self.replaced_seq = snapshot['replaced_seq']
+
+            # Trừ các row đã có trong snapshot nhưng bị ghi đè sau đó. seq <= replaced_seq đã được
+            # trừ trước khi snapshot được ghi (còn sót lại nếu crash trước DELETE trong save)
+            c = conn.cursor()
+            c.execute(f'''
+                SELECT {ROW_COLUMN_LIST} FROM replaced_sessions
+                WHERE seq > ? AND old_rowid <= ?
+            ''', (self.replaced_seq, self.last_rowid))
+            self.apply((dict(zip(ROW_COLUMNS, row)) for row in c.fetchall()), -1)
+            self.replaced_seq = max(self.replaced_seq, _max_replaced_seq(conn))
+
+            before = self.last_rowid
+            self._replay(conn)
+            self.archived_games = snapshot['archived_games']
+            self.loaded = True
+            return conn.execute('SELECT COUNT(*) FROM game_sessions WHERE rowid > ?', (before,)).fetchone()[0]
+
+    def save(self, conn, path=SNAPSHOT_FILE):
+        with self.lock:
+            if not self.loaded:
+                return
+            # Mốc lấy từ các row đã apply: process không ingest (vd. process cha của reloader) không
+            # được đánh dấu row của process khác là đã có. MAX(rowid) chỉ dùng để hạ mốc khi archive
+            # đã xóa các row cuối, để rowid được dùng lại sau snapshot vẫn được replay
+            snapshot = {
+                'version': SNAPSHOT_VERSION,
+                'created_at': time.time(),
+                'last_rowid': min(self.last_rowid, _max_rowid(conn)),
+                'replaced_seq': self.replaced_seq,
+                'archived_games': _archived_games(conn),
+                'components': {name: component.to_dict() for name, component in self.components.items()}
+            }
+
+            tmp_path = path + '.tmp'
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+
+            # Snapshot mới đã bao gồm các lần ghi đè tới replaced_seq; crash trước DELETE thì
+            # restore bỏ qua các row này nhờ replaced_seq trong snapshot
+            conn.execute('DELETE FROM replaced_sessions WHERE seq <= ?', (self.replaced_seq,))
+            conn.commit()
+
+
+def _apply_to(component, batch, sign):
+    apply_batch = getattr(component, 'apply_batch', None)
+    if apply_batch is not None:
+        apply_batch(batch, sign)
+    else:
+        for row in batch:
+            component.apply(row, sign)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _archived_games(conn):
+    row = conn.execute("SELECT count FROM archive_totals WHERE metric = 'games'").fetchone()
+    return row[0] if row else 0
+
+
+def _max_rowid(conn):
+    return conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM game_sessions').fetchone()[0]
+
+
+def _max_replaced_seq(conn):
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM replaced_sessions').fetchone()[0]
+
+
+def init_state_tables(c):
+    columns = ', '.join(f'{column} TEXT' if column in TEXT_COLUMNS else f'{column} INTEGER' for column in ROW_COLUMNS)
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS replaced_sessions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            old_rowid INTEGER,
+            {columns}
+        )
+    ''')
+
+
+state = LiveState()
+state.register(SessionAggregates())
+
+
+def load_state(db_path=DB_FILE):
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    replayed = state.restore(conn)
+    if replayed is None:
+        state.rebuild(conn)
+        print(f"🧮 Rebuilt live state from scratch in {(time.perf_counter() - started) * 1000:.1f} ms")
+    else:
+        print(f"🧮 Loaded state snapshot, replayed {replayed} rows in {(time.perf_counter() - started) * 1000:.1f} ms")
+    conn.close()
+
+
+def save_state(db_path=DB_FILE):
+    conn = sqlite3.connect(db_path)
+    try:
+        state.save(conn)
+    finally:
+        conn.close()
+
+
+def start_snapshotter(db_path=DB_FILE, interval=SNAPSHOT_INTERVAL_S):
+    def loop():
+        while not stop.wait(interval):
+            try:
+                save_state(db_path)
+            except Exception as e:
+                print(f"Error saving state snapshot: {e}")
+
+    stop = threading.Event()
+    threading.Thread(target=loop, daemon=True).start()
+    return stop
@@ -0,0 +1,191 @@
+import math
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Model đã train (pickle/joblib), load một lần khi server khởi động
+SCORE_MODEL_PATH = os.environ.get('PLANE_SCORE_MODEL', 'models/score_model.pkl')
+SURVIVAL_MODEL_PATH = os.environ.get('PLANE_SURVIVAL_MODEL', 'models/survival_model.pkl')
+
+# Micro-batching: gom request đồng thời thành một lần gọi predict
+MAX_BATCH_SIZE = 512
+MAX_WAIT_MS = 2
+REQUEST_TIMEOUT_S = 1.0
+
+# Thứ tự features giống báo cáo quarto (features_enhanced / rf_survival_model)
+SCORE_FEATURES = [
+    'coins_collected', 'ufos_shot', 'bullets_fired', 'game_duration', 'pipes_passed',
+    'aggressiveness', 'efficiency', 'accuracy', 'risk_taking'
+]
+SURVIVAL_FEATURES = [
+    'bullets_fired', 'ufos_shot', 'coins_collected',
+    'aggressiveness', 'efficiency', 'accuracy', 'pipe_pass_rate'
+]
+
+# Tên field phía client (plane.html) -> tên cột
+CLIENT_FIELDS = {
+    'score': 'score',
+    'coinsCollected': 'coins_collected',
+    'ufosShot': 'ufos_shot',
+    'bulletsFired': 'bullets_fired',
+    'gameDuration': 'game_duration',
+    'pipesPassed': 'pipes_passed'
+}
+
+
+class SessionError(ValueError):
+    pass
+
+
+def _rate(numerator, denominator):
+    return numerator / denominator if denominator > 0 else 0.0
+
+
+def build_features(session):
+    # Nhận cả camelCase (client) lẫn snake_case (DB); SessionError nếu không phải object gồm các số hữu hạn
+    # (JSON của Flask chấp nhận NaN / Infinity) - kiểm tra trước khi vào micro-batch chung
+    if not isinstance(session, dict):
+        raise SessionError('session must be an object')
+    raw = {}
+    for client_key, column in CLIENT_FIELDS.items():
+        value = session.get(client_key, session.get(column, 0))
+        if value is None:
+            value = 0
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SessionError(f'{client_key} must be a number')
+        try:
+            value = float(value)
+        except OverflowError:
+            value = math.inf
+        if not math.isfinite(value):
+            raise SessionError(f'{client_key} must be a finite number')
+        raw[column] = value
+
+    duration = raw['game_duration']
+    raw['aggressiveness'] = _rate(raw['bullets_fired'], duration)
+    raw['efficiency'] = _rate(raw['score'], duration)
+    raw['accuracy'] = _rate(raw['ufos_shot'], raw['bullets_fired'])
+    raw['risk_taking'] = _rate(raw['ufos_shot'], raw['pipes_passed'])
+    raw['pipe_pass_rate'] = _rate(raw['pipes_passed'], duration)
+    return raw
+
+
+def load_model(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        import joblib
+        return joblib.load(path)
+    except ImportError:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self._predict_fn = predict_fn
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            count = len(pending[0][0])
+            deadline = time.perf_counter() + self._max_wait
+
+            # Chờ tối đa max_wait_ms để gom thêm request
+            while count < self._max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            matrix = [row for rows, _ in pending for row in rows]
+            try:
+                outputs = self._predict_fn(matrix)
+            except Exception:
+                # Batch gộp lỗi: chạy lại từng request để lỗi chỉ trả về đúng request gây ra
+                for rows, future in pending:
+                    self._resolve(rows, future)
+                continue
+
+            offset = 0
+            for rows, future in pending:
+                future.set_result([float(v) for v in outputs[offset:offset + len(rows)]])
+                offset += len(rows)
+
+    def _resolve(self, rows, future):
+        try:
+            future.set_result([float(v) for v in self._predict_fn(rows)])
+        except Exception as e:
+            future.set_exception(e)
+
+
+class Predictor:
+    def __init__(self, score_model=None, survival_model=None):
+        self.score_model = score_model
+        self.survival_model = survival_model
+        self._score_batcher = MicroBatcher(self._predict_score) if score_model is not None else None
+        self._survival_batcher = MicroBatcher(self._predict_survival) if survival_model is not None else None
+
+    @property
+    def ready(self):
+        return self._score_batcher is not None or self._survival_batcher is not None
+
+    def _predict_score(self, matrix):
+        return self.score_model.predict(matrix)
+
+    def _predict_survival(self, matrix):
+        # Xác suất sống sót > 30s nếu model hỗ trợ predict_proba
+        if hasattr(self.survival_model, 'predict_proba'):
+            return [p[-1] for p in self.survival_model.predict_proba(matrix)]
+        return self.survival_model.predict(matrix)
+
+    def predict(self, sessions, timeout=REQUEST_TIMEOUT_S):
+        features = [build_features(s) for s in sessions]
+
+        score_future = survival_future = None
+        if self._score_batcher is not None:
+            score_future = self._score_batcher.submit([[f[k] for k in SCORE_FEATURES] for f in features])
+        if self._survival_batcher is not None:
+            survival_future = self._survival_batcher.submit([[f[k] for k in SURVIVAL_FEATURES] for f in features])
+
+        scores = score_future.result(timeout) if score_future else [None] * len(sessions)
+        survival = survival_future.result(timeout) if survival_future else [None] * len(sessions)
+
+        return [
+            {
+                'gameId': session.get('gameId'),
+                'predicted_score': None if score is None else round(score, 2),
+                'survival_probability': None if prob is None else round(prob, 4)
+            }
+            for session, score, prob in zip(sessions, scores, survival)
+        ]
+
+
+def load_predictor(score_path=SCORE_MODEL_PATH, survival_path=SURVIVAL_MODEL_PATH):
+    score_model = load_model(score_path)
+    survival_model = load_model(survival_path)
+
+    if score_model is None:
+        print(f"⚠️  Score model not found at {score_path}")
+    if survival_model is None:
+        print(f"⚠️  Survival model not found at {survival_path}")
+
+    return Predictor(score_model, survival_model)
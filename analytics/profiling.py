@@ -0,0 +1,348 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from flask import g, jsonify, request
+
+# Profiling theo yêu cầu cho một phần request trên các route được chọn - bật / tắt lúc runtime
+# qua /api/admin/profiling, không cần restart server
+PROFILE_DIR = os.environ.get('PLANE_PROFILE_DIR', 'profiles')
+# Không đặt token thì mọi endpoint admin trả 403
+ADMIN_TOKEN = os.environ.get('PLANE_ADMIN_TOKEN')
+ADMIN_PREFIX = '/api/admin/'
+
+MODES = ('cprofile', 'sampling')
+MAX_STACK_DEPTH = 64
+# Số request gần nhất giữ timing SQL chi tiết, số câu SQL tối đa ghi cho mỗi request
+MAX_SQL_REQUESTS = 500
+MAX_SQL_PER_REQUEST = 200
+SQL_TEXT_LENGTH = 200
+
+DEFAULT_SETTINGS = {
+    'enabled': False,
+    'mode': 'sampling',
+    'sample_rate': 0.1,
+    'routes': [],           # rỗng = mọi route, ví dụ ['/api/plane-stats', '/api/sync-analytics']
+    'sql_timing': True,
+    'interval_ms': 5
+}
+
+_real_connect = sqlite3.connect
+_local = threading.local()
+
+
+# SQL timing: connection factory đo thời gian từng câu lệnh của request đang được profile
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_sql(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_sql(sql, started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_fetch(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _record_fetch(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_fetch(started)
+
+    def __next__(self):
+        # Duyệt cursor (for row in c) cũng là fetch
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _record_fetch(started)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # conn.execute / executemany của sqlite3 không đi qua Cursor.execute: chuyển qua TimedCursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _timed_connect(*args, **kwargs):
+    kwargs.setdefault('factory', TimedConnection)
+    return _real_connect(*args, **kwargs)
+
+
+def _record_sql(sql, started):
+    statements = getattr(_local, 'sql', None)
+    if statements is None or len(statements) >= MAX_SQL_PER_REQUEST:
+        return
+    statements.append({
+        'sql': ' '.join(sql.split())[:SQL_TEXT_LENGTH],
+        'ms': (time.perf_counter() - started) * 1000
+    })
+
+
+def _record_fetch(started):
+    # Thời gian fetch cộng vào câu lệnh vừa chạy
+    statements = getattr(_local, 'sql', None)
+    if statements:
+        statements[-1]['ms'] += (time.perf_counter() - started) * 1000
+
+
+def _collapse(frame):
+    # Stack dạng 'outer;...;inner' cho flamegraph (collapsed stack format)
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.settings = dict(DEFAULT_SETTINGS)
+        # cProfile chỉ chạy cho một request tại một thời điểm
+        self._cprofile_lock = threading.Lock()
+        # Thread đang được sampling: thread id -> route
+        self._targets = {}
+        self._wakeup = threading.Event()
+        self._sampler = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.stats = {}
+            self.stacks = {}
+            self.sql = {}
+            self.sql_requests = deque(maxlen=MAX_SQL_REQUESTS)
+
+    def configure(self, updates):
+        settings = dict(self.settings)
+        for key, value in updates.items():
+            if key not in DEFAULT_SETTINGS:
+                raise ValueError(f'Unknown setting: {key}')
+            settings[key] = value
+
+        if not isinstance(settings['enabled'], bool) or not isinstance(settings['sql_timing'], bool):
+            raise ValueError('enabled and sql_timing must be booleans')
+        if settings['mode'] not in MODES:
+            raise ValueError(f'mode must be one of {list(MODES)}')
+        if isinstance(settings['sample_rate'], bool) or not isinstance(settings['sample_rate'], (int, float)) \
+                or not 0 <= settings['sample_rate'] <= 1:
+            raise ValueError('sample_rate must be between 0 and 1')
+        if not isinstance(settings['routes'], list) or not all(isinstance(r, str) for r in settings['routes']):
+            raise ValueError('routes must be a list of paths')
+        if isinstance(settings['interval_ms'], bool) or not isinstance(settings['interval_ms'], int) \
+                or not 1 <= settings['interval_ms'] <= 1000:
+            raise ValueError('interval_ms must be an integer between 1 and 1000')
+
+        self.settings = settings
+        # Chỉ thay sqlite3.connect khi đang đo SQL, tắt là trả lại nguyên bản
+        sqlite3.connect = _timed_connect if settings['enabled'] and settings['sql_timing'] else _real_connect
+        return settings
+
+    def should_profile(self, route, path):
+        settings = self.settings
+        if not settings['enabled'] or path.startswith(ADMIN_PREFIX):
+            return False
+        if settings['routes'] and route not in settings['routes'] and path not in settings['routes']:
+            return False
+        return random.random() < settings['sample_rate']
+
+    def start(self, route):
+        mode = self.settings['mode']
+        session = {'route': route, 'mode': mode, 'started': time.perf_counter(), 'profile': None}
+
+        if mode == 'cprofile' and self._cprofile_lock.acquire(blocking=False):
+            session['profile'] = cProfile.Profile()
+            session['profile'].enable()
+        elif mode == 'sampling':
+            self._ensure_sampler()
+            self._targets[threading.get_ident()] = route
+            self._wakeup.set()
+
+        if self.settings['sql_timing']:
+            _local.sql = []
+        return session
+
+    def finish(self, session):
+        elapsed_ms = (time.perf_counter() - session['started']) * 1000
+        route = session['route']
+
+        profile = session['profile']
+        if profile is not None:
+            profile.disable()
+            self._cprofile_lock.release()
+        self._targets.pop(threading.get_ident(), None)
+        statements = getattr(_local, 'sql', None)
+        _local.sql = None
+
+        with self.lock:
+            totals = self.requests.setdefault(route, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            totals['count'] += 1
+            totals['total_ms'] += elapsed_ms
+            totals['max_ms'] = max(totals['max_ms'], elapsed_ms)
+
+            if profile is not None:
+                if route in self.stats:
+                    self.stats[route].add(profile)
+                else:
+                    self.stats[route] = pstats.Stats(profile)
+
+            if statements is not None:
+                self.sql_requests.append({
+                    'route': route,
+                    'method': request.method,
+                    'ms': round(elapsed_ms, 3),
+                    'sql_ms': round(sum(s['ms'] for s in statements), 3),
+                    'statements': [{'sql': s['sql'], 'ms': round(s['ms'], 3)} for s in statements]
+                })
+                for statement in statements:
+                    summary = self.sql.setdefault(statement['sql'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                    summary['count'] += 1
+                    summary['total_ms'] += statement['ms']
+                    summary['max_ms'] = max(summary['max_ms'], statement['ms'])
+
+    def _ensure_sampler(self):
+        with self.lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            if not self._targets:
+                # Không có request nào đang được sampling: ngủ tới khi có
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, route in list(self._targets.items()):
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stacks = self.stacks.setdefault(route, {})
+                    stack = _collapse(frame)
+                    stacks[stack] = stacks.get(stack, 0) + 1
+            time.sleep(self.settings['interval_ms'] / 1000)
+
+    def summary(self):
+        with self.lock:
+            return {
+                'settings': self.settings,
+                'requests': {
+                    route: {**totals, 'avg_ms': round(totals['total_ms'] / totals['count'], 3)}
+                    for route, totals in self.requests.items()
+                },
+                'sampled_stacks': {route: sum(stacks.values()) for route, stacks in self.stacks.items()},
+                'slowest_sql': sorted(
+                    ({'sql': sql, **totals} for sql, totals in self.sql.items()),
+                    key=lambda s: s['total_ms'], reverse=True
+                )[:10]
+            }
+
+    def dump(self, profile_dir=PROFILE_DIR):
+        # Mỗi lần dump một thư mục theo thời điểm: .prof (pstats), .txt (top hàm),
+        # .collapsed (flamegraph), SQL timing tổng hợp + theo từng request
+        target = os.path.join(profile_dir, time.strftime('%Y%m%d-%H%M%S'))
+        os.makedirs(target, exist_ok=True)
+        written = []
+
+        with self.lock:
+            for route, stats in self.stats.items():
+                base = os.path.join(target, _route_filename(route))
+                stats.dump_stats(base + '.prof')
+                stream = io.StringIO()
+                pstats.Stats(base + '.prof', stream=stream).sort_stats('cumulative').print_stats(40)
+                with open(base + '.txt', 'w', encoding='utf-8') as f:
+                    f.write(stream.getvalue())
+                written += [base + '.prof', base + '.txt']
+
+            for route, stacks in self.stacks.items():
+                path = os.path.join(target, _route_filename(route) + '.collapsed')
+                with open(path, 'w', encoding='utf-8') as f:
+                    for stack, count in sorted(stacks.items()):
+                        f.write(f'{stack} {count}\n')
+                written.append(path)
+
+            path = os.path.join(target, 'sql_requests.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                for entry in self.sql_requests:
+                    f.write(json.dumps(entry) + '\n')
+            written.append(path)
+
+        path = os.path.join(target, 'summary.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        written.append(path)
+        return written
+
+
+def _route_filename(route):
+    name = route.strip('/').replace('/', '_').replace('<', '').replace('>', '')
+    return name or 'root'
+
+
+profiler = Profiler()
+
+
+def init_profiling(app):
+    @app.before_request
+    def start_profiling():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        if profiler.should_profile(rule, request.path):
+            g.profile_session = profiler.start(rule)
+
+    @app.teardown_request
+    def finish_profiling(error=None):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            profiler.finish(session)
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled (PLANE_ADMIN_TOKEN is not set)'}), 403
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
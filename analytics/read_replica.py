@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import threading
+import time
+
+DB_FILE = 'plane_analytics.db'
+
+# Bản sao read-only cho dashboard, được làm mới định kỳ bằng online backup API
+REPLICA_ENABLED = os.environ.get('PLANE_READ_REPLICA', '1') == '1'
+REPLICA_FILE = os.environ.get('PLANE_REPLICA_FILE', 'plane_analytics_replica.db')
+REFRESH_INTERVAL_S = float(os.environ.get('PLANE_REPLICA_REFRESH', 5))
+# Replica cũ hơn mức này thì đọc thẳng từ DB chính
+MAX_STALENESS_S = float(os.environ.get('PLANE_REPLICA_MAX_STALENESS', 30))
+
+_refresh_lock = threading.Lock()
+_snapshot_time = None
+
+
+def refresh_replica(db_path=DB_FILE, replica_path=REPLICA_FILE):
+    global _snapshot_time
+    with _refresh_lock:
+        started = time.time()
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(replica_path)
+        try:
+            # pages=-1: chép toàn bộ trong một bước, snapshot nhất quán của DB chính
+            source.backup(target, pages=-1)
+        finally:
+            target.close()
+            source.close()
+        _snapshot_time = started
+
+
+def staleness():
+    if _snapshot_time is None:
+        return None
+    return time.time() - _snapshot_time
+
+
+def read_connection(db_path=DB_FILE, replica_path=REPLICA_FILE):
+    # Trả về (connection, độ trễ dữ liệu tính bằng giây)
+    lag = staleness()
+    if REPLICA_ENABLED and lag is not None and lag <= MAX_STALENESS_S:
+        return sqlite3.connect(f'file:{replica_path}?mode=ro', uri=True), lag
+    return sqlite3.connect(db_path), 0.0
+
+
+def staleness_info(lag):
+    return {
+        'staleness_s': round(lag, 3),
+        'max_staleness_s': MAX_STALENESS_S if REPLICA_ENABLED else 0
+    }
+
+
+def start_replica_refresher(db_path=DB_FILE, interval=REFRESH_INTERVAL_S):
+    if not REPLICA_ENABLED:
+        return None
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                refresh_replica(db_path)
+            except Exception as e:
+                print(f"Error refreshing read replica: {e}")
+
+    refresh_replica(db_path)
+    stop = threading.Event()
+    threading.Thread(target=loop, daemon=True).start()
+    return stop
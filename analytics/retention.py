@@ -0,0 +1,244 @@
+import csv
+import glob
+import gzip
+import os
+import sqlite3
+import threading
+
+from timestamps import EPOCH_COLUMNS, in_range, to_epoch_ms
+
+DB_FILE = 'plane_analytics.db'
+
+# Session cũ hơn RETENTION_DAYS được chuyển sang file archive nén theo tháng
+RETENTION_DAYS = int(os.environ.get('PLANE_RETENTION_DAYS', 90))
+ARCHIVE_DIR = os.environ.get('PLANE_ARCHIVE_DIR', 'archive')
+ARCHIVE_INTERVAL_S = int(os.environ.get('PLANE_ARCHIVE_INTERVAL', 3600))
+ARCHIVE_BATCH = 1000
+# Số page giải phóng mỗi lần incremental vacuum
+VACUUM_PAGES = 2000
+
+SESSION_COLUMNS = [
+    'id', 'start_time', 'end_time', 'score', 'coins_collected', 'ufos_shot',
+    'bullets_fired', 'death_reason', 'game_duration', 'pipes_passed', 'start_ms', 'end_ms', 'received_at'
+]
+SESSION_COLUMN_LIST = ', '.join(SESSION_COLUMNS)
+# received_at NULL (row ghi với received_at rỗng): dùng thời điểm kết thúc game thay thế
+RECEIVED_AT_SQL = "COALESCE(received_at, datetime(end_ms / 1000, 'unixepoch'))"
+INTEGER_COLUMNS = {
+    'score', 'coins_collected', 'ufos_shot', 'bullets_fired', 'game_duration', 'pipes_passed', 'start_ms', 'end_ms'
+}
+
+# Các cột cần giữ tổng / max all-time cho stats endpoints
+AGGREGATE_COLUMNS = ['score', 'game_duration', 'bullets_fired']
+
+SCORE_BUCKETS = ['0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39', '40-44', '45-49', '50+']
+
+
+def score_bucket(score):
+    if score >= 50:
+        return '50+'
+    low = (score // 5) * 5
+    return f'{low}-{low + 4}'
+
+
+def init_archive_tables(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archive_totals (
+            metric TEXT PRIMARY KEY,
+            count INTEGER DEFAULT 0,
+            total REAL DEFAULT 0,
+            max_value REAL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archive_death_reasons (
+            death_reason TEXT PRIMARY KEY,
+            count INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archive_score_buckets (
+            bucket TEXT PRIMARY KEY,
+            count INTEGER DEFAULT 0
+        )
+    ''')
+
+
+def enable_incremental_vacuum(conn):
+    # auto_vacuum chỉ đổi được trên DB có sẵn sau một lần VACUUM đầy đủ
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+
+
+def migrate_received_at(conn, table):
+    # SQLite không ADD COLUMN được với DEFAULT CURRENT_TIMESTAMP: thêm cột nullable rồi backfill
+    # từ end_ms; row không có end_ms coi như vừa nhận lúc migrate
+    if 'received_at' in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+        return 0
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN received_at TIMESTAMP')
+    backfilled = conn.execute(f'''
+        UPDATE {table}
+        SET received_at = COALESCE(datetime(end_ms / 1000, 'unixepoch'), CURRENT_TIMESTAMP)
+        WHERE received_at IS NULL
+    ''').rowcount
+    conn.commit()
+    print(f"🕒 Backfilled received_at for {backfilled} rows in {table}")
+    return backfilled
+
+
+def archive_path(month, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f'game_sessions_{month}.csv.gz')
+
+
+def _append_archive(month, rows, archive_dir):
+    path = archive_path(month, archive_dir)
+    is_new = not os.path.exists(path)
+    header = SESSION_COLUMNS
+    if not is_new:
+        # File tạo trước khi có cột epoch ms: ghi tiếp theo header cũ của file
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            header = next(csv.reader(f), SESSION_COLUMNS)
+    if header != SESSION_COLUMNS:
+        rows = [[dict(zip(SESSION_COLUMNS, row)).get(column) for column in header] for row in rows]
+
+    # gzip append tạo thêm một member - vẫn đọc được như một file liên tục
+    with gzip.open(path, 'at', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(SESSION_COLUMNS)
+        writer.writerows(rows)
+
+
+def summarize_sessions(rows):
+    # rows: dict theo tên cột -> (totals, death_reasons, score_buckets) cùng dạng load_archive_aggregates
+    totals = {'games': {'count': 0, 'total': 0, 'max': None}}
+    reasons = {}
+    buckets = {}
+    for row in rows:
+        totals['games']['count'] += 1
+        for column in AGGREGATE_COLUMNS:
+            value = row[column]
+            if value is None:
+                continue
+            total = totals.setdefault(column, {'count': 0, 'total': 0, 'max': None})
+            total['count'] += 1
+            total['total'] += value
+            total['max'] = value if total['max'] is None else max(total['max'], value)
+        reason = row['death_reason']
+        if reason is not None:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        score = row['score']
+        if score is not None:
+            bucket = score_bucket(score)
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+    return totals, reasons, buckets
+
+
+def _update_aggregates(c, rows):
+    totals, reasons, buckets = summarize_sessions(dict(zip(SESSION_COLUMNS, row)) for row in rows)
+
+    c.execute('INSERT OR IGNORE INTO archive_totals (metric) VALUES (?)', ('games',))
+    c.execute('UPDATE archive_totals SET count = count + ? WHERE metric = ?', (len(rows), 'games'))
+
+    for column in AGGREGATE_COLUMNS:
+        total = totals.get(column)
+        if total is None:
+            continue
+        c.execute('INSERT OR IGNORE INTO archive_totals (metric) VALUES (?)', (column,))
+        c.execute('''
+            UPDATE archive_totals
+            SET count = count + ?, total = total + ?, max_value = MAX(COALESCE(max_value, ?), ?)
+            WHERE metric = ?
+        ''', (total['count'], total['total'], total['max'], total['max'], column))
+
+    c.executemany('INSERT OR IGNORE INTO archive_death_reasons (death_reason) VALUES (?)', [(r,) for r in reasons])
+    c.executemany('UPDATE archive_death_reasons SET count = count + ? WHERE death_reason = ?',
+                  [(n, r) for r, n in reasons.items()])
+    c.executemany('INSERT OR IGNORE INTO archive_score_buckets (bucket) VALUES (?)', [(b,) for b in buckets])
+    c.executemany('UPDATE archive_score_buckets SET count = count + ? WHERE bucket = ?',
+                  [(n, b) for b, n in buckets.items()])
+
+
+def archive_old_sessions(db_path=DB_FILE, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR):
+    os.makedirs(archive_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    archived = 0
+
+    while True:
+        c.execute(f'''
+            SELECT rowid, {SESSION_COLUMN_LIST.replace('received_at', RECEIVED_AT_SQL)}
+            FROM game_sessions
+            WHERE received_at < datetime('now', :age)
+               OR (received_at IS NULL AND end_ms < (unixepoch('now', :age) * 1000))
+            ORDER BY received_at
+            LIMIT :limit
+        ''', {'age': f'-{retention_days} days', 'limit': ARCHIVE_BATCH})
+        batch = c.fetchall()
+        if not batch:
+            break
+
+        # Phân vùng theo tháng nhận (received_at = 'YYYY-MM-DD HH:MM:SS', luôn khác NULL nhờ RECEIVED_AT_SQL)
+        by_month = {}
+        for row in batch:
+            by_month.setdefault(row[-1][:7], []).append(row[1:])
+        for month, rows in by_month.items():
+            _append_archive(month, rows, archive_dir)
+
+        # Ghi file trước rồi mới xóa: nếu lỗi giữa chừng chỉ bị trùng, không mất dữ liệu
+        _update_aggregates(c, [row[1:] for row in batch])
+        c.executemany('DELETE FROM game_sessions WHERE rowid = ?', [(row[0],) for row in batch])
+        conn.commit()
+        archived += len(batch)
+
+    c.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})')
+    conn.commit()
+    conn.close()
+
+    if archived:
+        print(f"📦 Archived {archived} sessions older than {retention_days} days")
+    return archived
+
+
+def load_archive_aggregates(c):
+    totals = {
+        metric: {'count': count, 'total': total, 'max': max_value}
+        for metric, count, total, max_value in c.execute('SELECT metric, count, total, max_value FROM archive_totals')
+    }
+    death_reasons = dict(c.execute('SELECT death_reason, count FROM archive_death_reasons'))
+    score_buckets = dict(c.execute('SELECT bucket, count FROM archive_score_buckets'))
+    return totals, death_reasons, score_buckets
+
+
+def iter_archived_sessions(archive_dir=ARCHIVE_DIR, time_range=None):
+    for path in sorted(glob.glob(os.path.join(archive_dir, 'game_sessions_*.csv.gz'))):
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            for record in csv.DictReader(f):
+                for column in INTEGER_COLUMNS:
+                    record[column] = int(record[column]) if record.get(column, '') != '' else None
+                for column in ('start_time', 'end_time', 'death_reason'):
+                    record[column] = record[column] or None
+                # File archive cũ chưa có cột epoch ms
+                for text_column, ms_column in EPOCH_COLUMNS:
+                    if record[ms_column] is None:
+                        record[ms_column] = to_epoch_ms(record[text_column])
+                if in_range(record['end_ms'], time_range):
+                    yield record
+
+
+def start_archiver(db_path=DB_FILE, interval=ARCHIVE_INTERVAL_S):
+    def loop():
+        while not stop.wait(interval):
+            try:
+                archive_old_sessions(db_path)
+            except Exception as e:
+                print(f"Error archiving sessions: {e}")
+
+    stop = threading.Event()
+    threading.Thread(target=loop, daemon=True).start()
+    return stop
+
+
+if __name__ == '__main__':
+    archive_old_sessions()
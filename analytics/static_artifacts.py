@@ -0,0 +1,147 @@
+import glob
+import gzip
+import hashlib
+import json
+import os
+import struct
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# File tĩnh cho site: stats.json / analytics.json là file tóm tắt nhỏ (tên cố định, cache ngắn),
+# dữ liệu chi tiết nằm trong các chunk có hash nội dung trong tên (cache vĩnh viễn)
+ARTIFACT_DIR = os.path.join('static', 'data')
+CHUNK_ROWS = 5000
+# Chunk không còn được file tóm tắt nào tham chiếu sẽ bị xóa sau thời gian này
+# (client đang giữ bản tóm tắt cũ vẫn tải được chunk cũ)
+STALE_CHUNK_AGE_S = 3600
+
+# Scatter plot dạng nhị phân theo cột: header 'PSC1', số row (u32), số cột (u8),
+# tên các cột, đệm tới bội số của 4, rồi mỗi cột là mảng int32 little-endian (NULL = -1)
+SCATTER_MAGIC = b'PSC1'
+SCATTER_COLUMNS = ['score', 'coins', 'ufos', 'bullets', 'duration']
+NULL_VALUE = -1
+
+MANIFESTS = ('stats.json', 'analytics.json')
+
+
+def minified(data):
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _write_atomic(path, content):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+def write_artifact(name, content, directory=ARTIFACT_DIR, hashed=True):
+    # Ghi file + bản nén sẵn .gz / .br; trả về tên file (có hash nếu hashed)
+    os.makedirs(directory, exist_ok=True)
+    if hashed:
+        stem, ext = os.path.splitext(name)
+        name = f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+    path = os.path.join(directory, name)
+    # Cùng hash = cùng nội dung: chunk không đổi giữa hai lần export thì không ghi lại
+    if hashed and os.path.exists(path):
+        return name
+
+    _write_atomic(path, content)
+    # mtime cố định để .gz giống hệt nhau giữa các lần build
+    _write_atomic(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write_atomic(path + '.br', brotli.compress(content, quality=11))
+    return name
+
+
+def encode_scatter(games):
+    header = SCATTER_MAGIC + struct.pack('<IB', len(games), len(SCATTER_COLUMNS))
+    for column in SCATTER_COLUMNS:
+        encoded = column.encode('ascii')
+        header += struct.pack('<B', len(encoded)) + encoded
+    header += b'\0' * (-len(header) % 4)
+
+    body = b''.join(
+        struct.pack(f'<{len(games)}i', *(NULL_VALUE if g[column] is None else g[column] for g in games))
+        for column in SCATTER_COLUMNS
+    )
+    return header + body
+
+
+def write_chunks(prefix, columns, rows, directory=ARTIFACT_DIR):
+    # Chia rows (list tuple theo columns) thành các chunk JSON dạng {columns, rows}
+    chunks = []
+    for start in range(0, len(rows), CHUNK_ROWS):
+        part = rows[start:start + CHUNK_ROWS]
+        name = write_artifact(f'{prefix}.json', minified({'columns': columns, 'rows': part}), directory)
+        chunks.append({'file': name, 'rows': len(part)})
+    return chunks
+
+
+def build_stats_artifacts(stats, directory=ARTIFACT_DIR):
+    # stats.json chỉ giữ aggregates + recent_games; all_games chuyển sang chunk tải lazy
+    games = stats.get('all_games', [])
+    summary = {key: value for key, value in stats.items() if key != 'all_games'}
+
+    scatter_rows = [[game[column] for column in SCATTER_COLUMNS] for game in games]
+    summary['chunks'] = {
+        'scatter': write_chunks('scatter', SCATTER_COLUMNS, scatter_rows, directory),
+        'scatter_bin': {
+            'file': write_artifact('scatter.bin', encode_scatter(games), directory),
+            'rows': len(games),
+            'columns': SCATTER_COLUMNS
+        }
+    }
+
+    write_artifact('stats.json', minified(summary), directory, hashed=False)
+    _remove_stale(directory)
+    return summary
+
+
+def build_data_artifacts(games, last_updated, directory=ARTIFACT_DIR):
+    # analytics.json: tóm tắt + danh sách chunk; session nằm trong analytics.<hash>.json
+    columns = list(games[0]) if games else []
+    rows = [[game[column] for column in columns] for game in games]
+    summary = {
+        'last_updated': last_updated,
+        'total_games': len(games),
+        'columns': columns,
+        'chunks': write_chunks('analytics', columns, rows, directory)
+    }
+
+    write_artifact('analytics.json', minified(summary), directory, hashed=False)
+    _remove_stale(directory)
+    return summary
+
+
+def _referenced(directory):
+    names = set()
+    for manifest in MANIFESTS:
+        path = os.path.join(directory, manifest)
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            chunks = json.load(f).get('chunks', {})
+        groups = chunks.values() if isinstance(chunks, dict) else [chunks]
+        for group in groups:
+            for chunk in group if isinstance(group, list) else [group]:
+                names.add(chunk['file'])
+    return names
+
+
+def _remove_stale(directory):
+    referenced = _referenced(directory)
+    cutoff = time.time() - STALE_CHUNK_AGE_S
+    for prefix in ('scatter', 'analytics'):
+        for path in glob.glob(os.path.join(directory, f'{prefix}.*.*')):
+            base = path
+            for suffix in ('.gz', '.br'):
+                if base.endswith(suffix):
+                    base = base[:-len(suffix)]
+            name = os.path.basename(base)
+            if name not in MANIFESTS and name not in referenced and os.path.getmtime(path) < cutoff:
+                os.remove(path)
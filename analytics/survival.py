@@ -0,0 +1,83 @@
+from retention import ARCHIVE_DIR, iter_archived_sessions
+from timestamps import RANGE_SQL, range_params
+
+# Đường cong sống sót S(t) = P(X > t) cho game_duration và pipes_passed,
+# tính từ mảng đếm theo bin được cập nhật khi ingest
+SURVIVAL_BINS = {
+    'game_duration': 300,   # giây, bin 1s, giá trị >= 300 gộp vào bin cuối
+    'pipes_passed': 200
+}
+DEFAULT_THRESHOLD = {'game_duration': 30, 'pipes_passed': 10}
+ALL_REASONS = '__all__'
+
+
+class SurvivalCurves:
+    name = 'survival'
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # counts[metric][death_reason] = số session có value == bin (bin cuối: >=)
+        self.counts = {metric: {} for metric in SURVIVAL_BINS}
+
+    def _bins(self, metric, reason):
+        bins = self.counts[metric].get(reason)
+        if bins is None:
+            bins = self.counts[metric][reason] = [0] * (SURVIVAL_BINS[metric] + 1)
+        return bins
+
+    def add(self, metric, reason, value, count):
+        index = min(max(int(value), 0), SURVIVAL_BINS[metric])
+        self._bins(metric, ALL_REASONS)[index] += count
+        if reason is not None:
+            self._bins(metric, reason)[index] += count
+
+    def apply(self, row, sign):
+        for metric in SURVIVAL_BINS:
+            if row[metric] is not None:
+                self.add(metric, row['death_reason'], row[metric], sign)
+
+    def curve(self, metric, reason=ALL_REASONS, threshold=None):
+        bins = self.counts[metric].get(reason) or [0] * (SURVIVAL_BINS[metric] + 1)
+        total = sum(bins)
+
+        # Một lượt cộng dồn: còn sống sau t = tổng - số session có value <= t
+        survival = []
+        ended = 0
+        for count in bins[:-1]:
+            ended += count
+            survival.append(round((total - ended) / total, 4) if total else 0)
+
+        result = {'total': total, 'survival': survival}
+        if threshold is not None and 0 <= threshold < len(survival):
+            result['survival_at_threshold'] = survival[threshold]
+        return result
+
+    def reasons(self, metric):
+        return sorted(reason for reason in self.counts[metric] if reason != ALL_REASONS)
+
+    def to_dict(self):
+        return self.counts
+
+    def load(self, data):
+        self.counts = {metric: dict(data.get(metric, {})) for metric in SURVIVAL_BINS}
+
+
+def survival_from_db(c, metric, time_range=None, archive_dir=ARCHIVE_DIR):
+    # Khi chưa load live state hoặc có lọc ?from=&to=: GROUP BY theo value trên dữ liệu hot,
+    # cộng thêm các session đã archive trong khoảng (giống /api/plane-stats)
+    curves = SurvivalCurves()
+    range_filter = '' if time_range is None else f'AND {RANGE_SQL}'
+    c.execute(f'''
+        SELECT MIN({metric}, ?), death_reason, COUNT(*)
+        FROM game_sessions
+        WHERE {metric} IS NOT NULL {range_filter}
+        GROUP BY 1, 2
+    ''', (SURVIVAL_BINS[metric],) + (range_params(time_range) if time_range else ()))
+    for value, reason, count in c.fetchall():
+        curves.add(metric, reason, value, count)
+    for row in iter_archived_sessions(archive_dir, time_range):
+        if row[metric] is not None:
+            curves.add(metric, row['death_reason'], row[metric], 1)
+    return curves
@@ -0,0 +1,28 @@
+import sqlite3
+
+from event_log import EventLog, init_event_tables, parse_events
+
+
+def test_parse_events_rejects_empty_batch():
+    events, error = parse_events([])
+    assert events is None and error
+
+
+def test_compact_skips_empty_batches_and_later_segments(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'plane_analytics.db')
+    init_event_tables(conn)
+    log = EventLog('plane', root=str(tmp_path / 'events'))
+
+    # Segment cũ có batch rỗng, theo sau là một segment bình thường
+    log.append('x', [])
+    log._seal()
+    log.append('y', [(5, 1, 0), (1, 2, 0)])
+    log._seal()
+
+    assert log.compact(conn) == 2
+    assert log.timeline(conn, 'x') == []
+    assert log.timeline(conn, 'y') == [
+        {'t': 1, 'type': 'bullet_fired', 'value': 0},
+        {'t': 5, 'type': 'pipe_passed', 'value': 0}
+    ]
+    conn.close()
@@ -0,0 +1,136 @@
+import sqlite3
+
+import pytest
+
+import analytics_plane
+from live_state import SNAPSHOT_FILE, LiveState
+from live_state import state as live_state
+from retention import archive_old_sessions
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # init_db, snapshot và archive dùng đường dẫn tương đối: chạy trong thư mục tạm
+    monkeypatch.chdir(tmp_path)
+    analytics_plane.init_db()
+    conn = sqlite3.connect('plane_analytics.db')
+    live_state.loaded = False
+    live_state.rebuild(conn)
+    yield conn
+    # Không để atexit của analytics_plane ghi snapshot của test
+    live_state.loaded = False
+    conn.close()
+
+
+def session(game_id, score, death_reason='pipe'):
+    return {
+        'gameId': game_id,
+        'startTime': '2024-01-01T00:00:00Z',
+        'endTime': '2024-01-01T00:01:00Z',
+        'score': score,
+        'coinsCollected': 1,
+        'ufosShot': 2,
+        'bulletsFired': 10,
+        'deathReason': death_reason,
+        'gameDuration': 60,
+        'pipesPassed': score
+    }
+
+
+def ingest(conn, sessions):
+    stored, rejected = analytics_plane.store_sessions(conn, sessions)
+    assert stored == len(sessions) and not rejected
+
+
+def new_state():
+    # Cùng các component với state của server
+    state = LiveState()
+    for component in live_state.components.values():
+        state.register(type(component)())
+    return state
+
+
+def summary(state):
+    return (
+        state.component('aggregates').summary(),
+        state.component('leaderboard').top('score', 'all', 10),
+        state.component('survival').curve('game_duration'),
+        state.component('correlations').moments.n
+    )
+
+
+def rebuilt_summary(conn):
+    state = new_state()
+    state.rebuild(conn)
+    return summary(state)
+
+
+def restored(conn):
+    state = new_state()
+    assert state.restore(conn, SNAPSHOT_FILE) is not None
+    return state
+
+
+def test_restore_replays_rows_and_replacements_after_snapshot(db):
+    ingest(db, [session('a', 5), session('b', 12)])
+    live_state.save(db)
+
+    ingest(db, [session('a', 40, 'ufo'), session('c', 3)])
+
+    state = new_state()
+    assert state.restore(db, SNAPSHOT_FILE) == 2
+    assert summary(state) == summary(live_state) == rebuilt_summary(db)
+
+
+def test_crash_before_replaced_sessions_delete_does_not_double_subtract(db):
+    ingest(db, [session('a', 5), session('b', 12)])
+    ingest(db, [session('a', 40, 'ufo')])
+    pending = db.execute('SELECT * FROM replaced_sessions').fetchall()
+
+    live_state.save(db)
+    # Giả lập crash giữa os.replace và commit DELETE FROM replaced_sessions
+    db.executemany(f'INSERT INTO replaced_sessions VALUES ({", ".join("?" * len(pending[0]))})', pending)
+    db.commit()
+
+    assert summary(restored(db)) == rebuilt_summary(db)
+
+
+def test_save_from_process_that_never_ingested_keeps_later_rows(db):
+    ingest(db, [session('a', 5)])
+    live_state.save(db)
+
+    # Process cha của reloader: load state nhưng không nhận request
+    idle = restored(db)
+    ingest(db, [session('a', 20), session('b', 7)])
+    idle.save(db, SNAPSHOT_FILE)
+
+    assert summary(restored(db)) == summary(live_state) == rebuilt_summary(db)
+
+
+def test_rowids_reused_after_archiving_everything_are_replayed(db):
+    ingest(db, [session(f'old{i}', i) for i in range(5)])
+    live_state.save(db)
+
+    # Archive hết bảng hot: rowid mới bắt đầu lại từ 1, thấp hơn last_rowid của snapshot cũ
+    db.execute("UPDATE game_sessions SET received_at = '2000-01-01 00:00:00'")
+    db.commit()
+    archive_old_sessions('plane_analytics.db')
+
+    ingest(db, [session('new0', 7)])
+    live_state.save(db)
+    ingest(db, [session(f'new{i}', i) for i in range(1, 6)])
+
+    state = restored(db)
+    assert summary(state) == summary(live_state) == rebuilt_summary(db)
+    assert state.component('aggregates').games == 11
+
+
+def test_snapshot_above_current_rowids_is_rebuilt(db):
+    ingest(db, [session(f'old{i}', i) for i in range(5)])
+    live_state.save(db)
+    # Crash sau khi bảng bị xóa hết và ghi lại ít row hơn: snapshot không còn dùng được
+    db.execute('DELETE FROM game_sessions')
+    db.commit()
+    ingest(db, [session('new', 1)])
+
+    assert new_state().restore(db, SNAPSHOT_FILE) is None
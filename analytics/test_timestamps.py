@@ -0,0 +1,13 @@
+import pytest
+
+from timestamps import TimeRangeError, parse_time_range, to_epoch_ms
+
+
+@pytest.mark.parametrize('value', ['²', '-²', '١٢٣', '99999999999999999999', float('nan'), 'not a date'])
+def test_unparseable_values_are_none(value):
+    assert to_epoch_ms(value) is None
+
+
+def test_parse_time_range_rejects_unicode_digits():
+    with pytest.raises(TimeRangeError):
+        parse_time_range({'from': '²'})
@@ -0,0 +1,142 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+# start_time / end_time từ client là chuỗi ISO (đôi khi khác format) - chuẩn hóa một lần
+# thành epoch millisecond (INTEGER) để sắp xếp và lọc theo khoảng thời gian bằng index
+EPOCH_COLUMNS = [('start_time', 'start_ms'), ('end_time', 'end_ms')]
+BACKFILL_BATCH = 5000
+
+# Bộ lọc ?from=&to= luôn áp dụng trên end_ms: from tính cả, to không tính
+RANGE_SQL = 'end_ms >= ? AND end_ms < ?'
+MIN_MS, MAX_MS = -2 ** 63, 2 ** 63 - 1
+
+# Format Date.toString() của trình duyệt, ví dụ 'Mon Jan 01 2024 12:00:00 GMT+0700 (...)'
+JS_DATE_FORMAT = '%a %b %d %Y %H:%M:%S GMT%z'
+
+
+class TimeRangeError(ValueError):
+    pass
+
+
+def to_epoch_ms(value):
+    # Trả về epoch ms (int) hoặc None nếu không parse được / nằm ngoài INTEGER 64-bit của SQLite;
+    # số nguyên được hiểu là epoch ms
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return _int64(int(value)) if math.isfinite(value) else None
+
+    text = str(value).strip()
+    if not text:
+        return None
+    # isdigit() cũng đúng với chữ số Unicode như '²' mà int() không parse được
+    if text.isascii() and text.lstrip('-').isdigit():
+        return _int64(int(text))
+
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            parsed = datetime.strptime(text.split(' (')[0], JS_DATE_FORMAT)
+        except ValueError:
+            return None
+
+    # Không có timezone: coi là UTC (SQLite CURRENT_TIMESTAMP, client cũ)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return round(parsed.timestamp() * 1000)
+
+
+def _int64(ms):
+    return ms if MIN_MS <= ms <= MAX_MS else None
+
+
+def ms_day(ms):
+    # Ngày UTC 'YYYY-MM-DD' của epoch ms, None nếu không có / ngoài khoảng datetime
+    if ms is None:
+        return None
+    try:
+        return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime('%Y-%m-%d')
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def day_range(day):
+    # Khoảng [start, end) epoch ms của một ngày UTC 'YYYY-MM-DD'
+    try:
+        start = datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise TimeRangeError("'day' must be a date in YYYY-MM-DD format")
+    end = start + timedelta(days=1)
+    return round(start.timestamp() * 1000), round(end.timestamp() * 1000)
+
+
+def parse_time_range(args):
+    # Đọc ?from=&to= (epoch ms hoặc ISO 8601); None nếu không có bộ lọc, TimeRangeError nếu sai
+    bounds = []
+    for key in ('from', 'to'):
+        raw = args.get(key)
+        if raw is None or raw == '':
+            bounds.append(None)
+            continue
+        ms = to_epoch_ms(raw)
+        if ms is None:
+            raise TimeRangeError(f"'{key}' must be epoch milliseconds (64-bit) or an ISO 8601 timestamp")
+        bounds.append(ms)
+
+    start, end = bounds
+    if start is None and end is None:
+        return None
+    if start is not None and end is not None and start > end:
+        raise TimeRangeError("'from' must not be after 'to'")
+    return start, end
+
+
+def range_params(time_range):
+    start, end = time_range
+    return (MIN_MS if start is None else start, MAX_MS if end is None else end)
+
+
+def in_range(ms, time_range):
+    # Cùng ngữ nghĩa với RANGE_SQL, cho dữ liệu đọc ngoài SQLite (archive)
+    if time_range is None:
+        return True
+    if ms is None:
+        return False
+    start, end = range_params(time_range)
+    return start <= ms < end
+
+
+def migrate_epoch_columns(conn, table, batch_size=BACKFILL_BATCH):
+    c = conn.cursor()
+    existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+    for _, ms_column in EPOCH_COLUMNS:
+        if ms_column not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {ms_column} INTEGER')
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_end_ms ON {table} (end_ms)')
+    conn.commit()
+
+    # Backfill theo batch (theo rowid), commit từng batch để không giữ write lock lâu.
+    # Row có chuỗi không parse được vẫn NULL nhưng không bị quét lại
+    backfilled = 0
+    last_rowid = 0
+    while True:
+        rows = c.execute(f'''
+            SELECT rowid, start_time, end_time FROM {table}
+            WHERE rowid > ?
+              AND ((start_ms IS NULL AND start_time IS NOT NULL) OR (end_ms IS NULL AND end_time IS NOT NULL))
+            ORDER BY rowid
+            LIMIT ?
+        ''', (last_rowid, batch_size)).fetchall()
+        if not rows:
+            break
+
+        updates = [(to_epoch_ms(start), to_epoch_ms(end), rowid) for rowid, start, end in rows]
+        c.executemany(f'UPDATE {table} SET start_ms = ?, end_ms = ? WHERE rowid = ?', updates)
+        conn.commit()
+        backfilled += sum(1 for start_ms, end_ms, _ in updates if start_ms is not None or end_ms is not None)
+        last_rowid = rows[-1][0]
+
+    if backfilled:
+        print(f"🕒 Backfilled epoch timestamps for {backfilled} rows in {table}")
+    return backfilled